@@ -2,6 +2,14 @@
 
 class Captain():
 
+    # the keys of to_dict(), which of them must be there,
+    # the values of missing ones (a captain without a surname
+    # has no surname attribute at all) and nested classes
+    FIELDS = ("name", "surname")
+    REQUIRED = ("name",)
+    DEFAULTS = {}
+    TYPES = {}
+
     def __init__(self, name, surname=""):
         self.name = name
         if surname:
@@ -12,3 +20,9 @@ class Captain():
         if hasattr(self, "surname"):
             name_string += " " + self.surname
         return name_string
+
+    def to_dict(self):
+        data = {"name": self.name}
+        if hasattr(self, "surname"):
+            data["surname"] = self.surname
+        return data
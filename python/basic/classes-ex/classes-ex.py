@@ -5,6 +5,12 @@ from captain import Captain
 class Starship():
     """This is a simple Starship class.""" # docstring
 
+    # the keys of to_dict() after "type", see captain.py
+    FIELDS = ("name", "captain", "stardate")
+    REQUIRED = ("name", "captain")
+    DEFAULTS = {"stardate": 0}
+    TYPES = {"captain": Captain}
+
     # self is required first argument for every method
     def __init__(self, name, captain):
         self.name = name
@@ -25,10 +31,22 @@ class Starship():
     def raise_shields(self):
         print("Raising shields.")
 
+    def to_dict(self):
+        return {
+                "type": type(self).__name__,
+                "name": self.name,
+                "captain": self.captain.to_dict(),
+                "stardate": self.stardate
+                }
+
 # Note: In Python2, class has to be defined with
 # object in parentheses, e.g.:
 # class Starship(object)
 
+# Note: The "type" key of to_dict() tells which class
+# to build again, FIELDS, REQUIRED and DEFAULTS how (see
+# python/storage/json-ex/schema.py)
+
 if __name__ == "__main__":
 
     # Note: Code inside the block will only be executed
@@ -52,6 +70,11 @@ if __name__ == "__main__":
 class KlingonStarship(Starship):
     """Specialized Klingon Starship class."""
 
+    FIELDS = Starship.FIELDS + ("lasers",)
+    REQUIRED = Starship.REQUIRED
+    DEFAULTS = dict(Starship.DEFAULTS, lasers=True)
+    TYPES = Starship.TYPES
+
     def __init__(self, captain, name="Unknown"):
         super().__init__(name, captain)
         self.lasers = True
@@ -74,6 +97,11 @@ class KlingonStarship(Starship):
     def raise_shields(self):
         print("Klingon shields raised.")
 
+    def to_dict(self):
+        data = super().to_dict()
+        data["lasers"] = self.lasers
+        return data
+
 if __name__ == "__main__":
 
     klingon_ship = KlingonStarship(Captain(name="Worf"))
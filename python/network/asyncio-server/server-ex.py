@@ -0,0 +1,304 @@
+# Python3 asyncio server example
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import HELLO_COMMAND, accept, reply_frame
+from compression import add_arguments as add_compression_arguments
+from fileserve import (
+        CHUNK_SIZE, GET_COMMAND, MAX_FILE_FRAME, FileRequestError,
+        error_frame, open_request, status_frame
+        )
+from fileserve import add_arguments as add_file_arguments
+from framing import FrameError, FrameReader, encode_frame, frame_header
+from netlog import add_arguments, message_log_from_args, setup_logging
+from stats import STATS_COMMAND, ServerStats
+from transport import bind_socket, close_socket, is_datagram
+from transport import add_arguments as add_transport_arguments
+
+OK_FRAME = encode_frame(b"OK")
+OK_DATAGRAM = b"OK"
+
+# Note: Once more than HIGH_WATER bytes of replies are
+# queued for a client that does not read them, we stop
+# reading from it until the queue drops below LOW_WATER
+
+HIGH_WATER = 64 * 1024
+LOW_WATER = 16 * 1024
+
+LAG_INTERVAL = 0.1
+
+stats = ServerStats()
+
+class ServerProtocol(asyncio.BufferedProtocol):
+    """One instance is created per accepted connection."""
+
+    # Note: BufferedProtocol lets the event loop receive
+    # straight into our FrameReader buffer (get_buffer)
+    # instead of handing us a new bytes object every time
+
+    def connection_made(self, transport):
+        self.transport = transport
+        # unix socket clients have no address
+        self.addr = transport.get_extra_info("peername") or "unix client"
+        self.reader = FrameReader()
+        self.sending = None
+        self.drained = None
+        self.codec = None
+
+        transport.set_write_buffer_limits(high=HIGH_WATER, low=LOW_WATER)
+
+        log.info("Accepted connection from: %s", self.addr)
+        stats.accepted += 1
+
+    def get_buffer(self, sizehint):
+        return self.reader.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        self.reader.advance(nbytes)
+        stats.bytes_in += nbytes
+
+        self.process_frames()
+
+    def process_frames(self):
+        replies = []
+
+        try:
+            # replies to messages after a GET wait for the file
+            while self.sending is None:
+                data = self.reader.next_frame()
+
+                if data is None:
+                    break
+
+                if self.codec is not None:
+                    data = self.codec.decode(data)
+
+                message_log(self.addr, data)
+                stats.messages_in += 1
+
+                if data == STATS_COMMAND:
+                    replies.append(reply_frame(self.codec, stats.encode()))
+                elif data.startswith(GET_COMMAND):
+                    self.write_replies(replies)
+                    self.start_file(data)
+                elif data.startswith(HELLO_COMMAND) and self.codec is None:
+                    reply, self.codec = accept(
+                            data, args.compress,
+                            args.compress_level, args.compress_threshold
+                            )
+                    replies.append(encode_frame(reply))
+                elif self.codec is None:
+                    replies.append(OK_FRAME)
+                else:
+                    replies.append(self.codec.frame(b"OK"))
+
+                stats.messages_out += 1
+
+                if not args.batch_replies:
+                    self.write_replies(replies)
+
+        except FrameError as err:
+            log.info("Dropping %s: %s", self.addr, err)
+            self.transport.abort()
+
+            return
+
+        # one write() for everything received at once
+        self.write_replies(replies)
+
+    def write_replies(self, replies):
+        if not replies:
+            return
+
+        reply = replies[0] if len(replies) == 1 else b"".join(replies)
+
+        self.transport.write(reply)
+        stats.bytes_out += len(reply)
+        replies.clear()
+
+    def start_file(self, request):
+        try:
+            file, offset, count = open_request(request, args.files_root)
+
+        except FileRequestError as err:
+            reply = reply_frame(self.codec, error_frame(err))
+            self.transport.write(reply)
+            stats.bytes_out += len(reply)
+
+            return
+
+        self.transport.write(
+                reply_frame(self.codec, status_frame(count)) +
+                frame_header(count, MAX_FILE_FRAME)
+                )
+        self.transport.pause_reading()
+
+        self.sending = asyncio.ensure_future(self.send_file(file, offset, count))
+        self.sending.add_done_callback(self.file_sent)
+
+    async def send_file(self, file, offset, count):
+        with file:
+            if not args.no_sendfile:
+                # os.sendfile() where possible, asyncio
+                # falls back to read() and write() itself
+                await asyncio.get_running_loop().sendfile(
+                        self.transport, file, offset, count
+                        )
+            else:
+                await self.write_file(file, offset, count)
+
+        stats.bytes_out += count
+
+    async def write_file(self, file, offset, count):
+        file.seek(offset)
+
+        while count:
+            data = file.read(min(count, CHUNK_SIZE))
+
+            if not data:
+                raise ConnectionError("file shrank while sending")
+
+            self.transport.write(data)
+            count -= len(data)
+
+            if self.transport.get_write_buffer_size() > HIGH_WATER:
+                self.drained = asyncio.get_running_loop().create_future()
+                await self.drained
+
+    def file_sent(self, task):
+        self.sending = None
+
+        if task.cancelled() or task.exception() is not None:
+            self.transport.abort()
+
+            return
+
+        self.transport.resume_reading()
+        self.process_frames()
+
+    def pause_writing(self):
+        # the peer stopped draining its replies
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.drained is not None and not self.drained.done():
+            self.drained.set_result(None)
+
+        if self.sending is None:
+            self.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        log.info("Closing connection to %s...", self.addr)
+        stats.closed += 1
+
+        if self.sending is not None:
+            self.sending.cancel()
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    """Answers every datagram with one datagram."""
+
+    # Note: The loop already reads every datagram that is
+    # ready before returning to select(), and sendto()
+    # drops replies the socket has no room for
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        message_log(addr, data)
+        stats.messages_in += 1
+        stats.bytes_in += len(data)
+
+        if data == STATS_COMMAND:
+            reply = stats.encode()
+        else:
+            reply = OK_DATAGRAM
+
+        self.transport.sendto(reply, addr)
+        stats.messages_out += 1
+        stats.bytes_out += len(reply)
+
+    def error_received(self, exc):
+        # e.g. ECONNREFUSED from an earlier reply
+        pass
+
+async def watch_loop_lag():
+    # how late the loop wakes us up is how long
+    # callbacks kept it busy (loop_us in STATS)
+    loop = asyncio.get_running_loop()
+
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag = loop.time() - started - LAG_INTERVAL
+
+        stats.loop_us.record(max(lag, 0) * 1000000)
+
+async def start_server(sock):
+    loop = asyncio.get_running_loop()
+
+    lag_task = asyncio.create_task(watch_loop_lag())
+
+    if is_datagram(sock):
+        log.info("Waiting for datagrams...")
+
+        transport, _ = await loop.create_datagram_endpoint(
+                DatagramProtocol,
+                sock=sock
+                )
+
+        try:
+            await loop.create_future()
+
+        finally:
+            transport.close()
+
+    # asyncio calls listen() itself, with a backlog of 100
+    # unless told otherwise
+    server = await loop.create_server(
+            ServerProtocol,
+            sock=sock,
+            backlog=args.backlog or socket.SOMAXCONN
+            )
+
+    log.info("Waiting for connections...")
+
+    async with server:
+        await server.serve_forever()
+
+parser = argparse.ArgumentParser(description="asyncio server example")
+add_transport_arguments(parser)
+add_arguments(parser)
+add_file_arguments(parser)
+add_compression_arguments(
+        parser, help="compress messages for clients that ask for it"
+        )
+args = parser.parse_args()
+
+# Note: asyncio sets TCP_NODELAY on every TCP connection
+# by itself, so --nodelay changes nothing here, and it
+# buffers writes the socket does not take in user space,
+# where TCP_CORK cannot see them
+
+if args.cork:
+    parser.error("--cork is not supported by the asyncio server")
+
+log = setup_logging()
+message_log = message_log_from_args(args)
+
+sock = bind_socket(args, log)
+
+try:
+    asyncio.run(start_server(sock))
+
+except KeyboardInterrupt:
+    log.info("Received keyboard interrupt.")
+
+finally:
+    close_socket(sock, args)
@@ -0,0 +1,404 @@
+# Python3 Network Benchmark Example
+#
+# Starts every server in python/network on a free port,
+# drives it with the load generator and writes the
+# results (throughput, latency, CPU time, peak RSS) into
+# a JSON file, optionally comparing them to a baseline.
+# With --transports tcp,unix,udp every scenario is run
+# over loopback TCP, a unix socket and UDP in turn, and
+# --compress LEVEL runs it with negotiated compression.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+NETWORK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(NETWORK_DIR)
+
+from loadgen import generated_payloads, run_load, text_payloads
+from stats import STATS_COMMAND
+
+# name: (script, extra arguments, serves several clients at once)
+SERVERS = {
+        "single": ("single-client-server/server-ex.py", [], False),
+        "single-threads": (
+            "single-client-server/server-ex.py", ["--threads", "16"], True
+            ),
+        "selector": ("multiple-clients-server/server-ex.py", [], True),
+        "selector-workers": (
+            "multiple-clients-server/server-ex.py", ["--workers", "4"], True
+            ),
+        "asyncio": ("asyncio-server/server-ex.py", [], True),
+        }
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+
+        return sock.getsockname()[1]
+
+def probe_server(family, sock_type, server_address):
+    with socket.socket(family, sock_type) as sock:
+        sock.settimeout(0.2)
+        sock.connect(server_address)
+
+        if sock_type == socket.SOCK_DGRAM:
+            # nothing to connect to, wait for a reply instead
+            sock.send(STATS_COMMAND)
+            sock.recv(65535)
+
+def wait_for_server(family, sock_type, server_address, process, timeout=10):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+
+        if process.poll() is not None:
+            raise RuntimeError("Server exited with code %d" % process.returncode)
+
+        try:
+            probe_server(family, sock_type, server_address)
+
+        except OSError:
+            time.sleep(0.05)
+
+        else:
+            return
+
+    raise RuntimeError("Server did not start in %ds" % timeout)
+
+def peak_rss_kb(pid):
+    """Sums VmHWM of a process and its children (Linux only)."""
+    total = 0
+    pids = [pid]
+
+    while pids:
+        pid = pids.pop()
+
+        try:
+            with open("/proc/%d/status" % pid) as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+
+            with open("/proc/%d/task/%d/children" % (pid, pid)) as children_file:
+                pids.extend(int(child) for child in children_file.read().split())
+
+        except OSError:
+            # gone already, or no /proc on this system
+            continue
+
+    return total or None
+
+def tcp_segments_out():
+    """TCP segments sent by the whole system so far (Linux only)."""
+    try:
+        with open("/proc/net/snmp") as snmp_file:
+            lines = [line.split() for line in snmp_file if line.startswith("Tcp:")]
+
+    except OSError:
+        return None
+
+    # a line of names followed by a line of values
+    return int(lines[1][lines[0].index("OutSegs")])
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return usage.ru_utime + usage.ru_stime
+
+def own_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return usage.ru_utime + usage.ru_stime
+
+def run_scenario(name, transport, connections, size, pipeline, messages,
+        extra_args, payload="repeated", compress_level=None):
+    script, server_args, _ = SERVERS[name]
+
+    if compress_level is not None:
+        server_args = server_args + [
+                "--compress", "--compress-level", str(compress_level)
+                ]
+
+    if payload == "text":
+        payloads = text_payloads(size, messages)
+    else:
+        payloads = generated_payloads(size, messages)
+
+    if transport == "unix":
+        family, sock_type = socket.AF_UNIX, socket.SOCK_STREAM
+        server_address = os.path.join(tempfile.gettempdir(),
+                "benchmark-%d.sock" % os.getpid())
+        address_args = ["--path", server_address]
+    else:
+        family = socket.AF_INET
+        sock_type = socket.SOCK_DGRAM if transport == "udp" else socket.SOCK_STREAM
+        server_address = ("127.0.0.1", free_port())
+        address_args = ["--port", str(server_address[1])]
+
+    cpu_before = children_cpu_seconds()
+
+    process = subprocess.Popen(
+            [sys.executable, os.path.join(NETWORK_DIR, script),
+                "--transport", transport] +
+                address_args + server_args + extra_args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+            )
+
+    try:
+        wait_for_server(family, sock_type, server_address, process)
+        segments_before = tcp_segments_out()
+        client_cpu_before = own_cpu_seconds()
+
+        results = run_load(
+                server_address,
+                connections=connections,
+                pipeline=pipeline,
+                payloads=payloads,
+                family=family,
+                sock_type=sock_type,
+                compress_level=compress_level
+                )
+
+        results["client_cpu_seconds"] = own_cpu_seconds() - client_cpu_before
+        segments = tcp_segments_out()
+        results["max_rss_kb"] = peak_rss_kb(process.pid)
+
+    finally:
+        process.terminate()
+        process.wait()
+
+    results["server"] = name
+    results["transport"] = transport
+    results["compress_level"] = compress_level
+    results["size"] = size
+    results["cpu_seconds"] = children_cpu_seconds() - cpu_before
+
+    if segments is not None and transport == "tcp" and results["messages"]:
+        # both directions, so at least 2 without coalescing
+        results["segments_per_msg"] = (
+                (segments - segments_before) / results["messages"]
+                )
+    else:
+        results["segments_per_msg"] = None
+
+    return results
+
+def scenario_key(results):
+    # older results files were all tcp
+    transport = results.get("transport", "tcp")
+    server = results["server"]
+
+    if transport != "tcp":
+        server += "+" + transport
+
+    if results.get("compress_level") is not None:
+        server += "+zlib%d" % results["compress_level"]
+
+    return "%s/c%d/s%d/p%d" % (
+            server, results["connections"],
+            results["size"], results["pipeline"]
+            )
+
+def compare(results, baseline, threshold):
+    """Returns a list of regressions worse than threshold percent."""
+    previous = {scenario_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+
+    for entry in results:
+        key = scenario_key(entry)
+
+        if key not in previous:
+            continue
+
+        old = previous[key]
+
+        # (metric, True if higher is better)
+        for metric, higher_is_better in (
+                ("messages_per_sec", True),
+                ("p99_ms", False),
+                ("cpu_seconds", False)
+                ):
+
+            if not old[metric]:
+                continue
+
+            change = (entry[metric] - old[metric]) / old[metric] * 100
+
+            if higher_is_better:
+                change = -change
+
+            if change > threshold:
+                regressions.append(
+                        "%s: %s %.3f -> %.3f (%.1f%% worse)" %
+                        (key, metric, old[metric], entry[metric], change)
+                        )
+
+    return regressions
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+parser = argparse.ArgumentParser(description="Network benchmark example")
+parser.add_argument(
+        "--servers", default=",".join(SERVERS),
+        help="comma separated servers to run (default: all)"
+        )
+parser.add_argument(
+        "--transports", default="tcp",
+        help="comma separated transports: tcp, unix, udp (default: tcp)"
+        )
+parser.add_argument("--clients", type=int_list, default=[1, 16])
+parser.add_argument("--sizes", type=int_list, default=[64, 4096])
+parser.add_argument("--pipeline", type=int, default=1)
+parser.add_argument("--messages", type=int, default=20000)
+parser.add_argument(
+        "--payload", choices=("repeated", "text"), default="repeated",
+        help="repeated bytes or JSON text records (default: repeated)"
+        )
+parser.add_argument(
+        "--compress", type=int, default=None, metavar="LEVEL",
+        help="also run every scenario compressed at this zlib level"
+        )
+parser.add_argument("--output", default="results.json")
+parser.add_argument(
+        "--baseline",
+        help="fail if results regressed compared to this results file"
+        )
+parser.add_argument(
+        "--threshold", type=float, default=10.0,
+        help="allowed regression in percent (default: 10)"
+        )
+parser.add_argument(
+        "--server-args", default="",
+        help="extra arguments passed to every server"
+        )
+args = parser.parse_args()
+
+all_results = []
+
+transports = args.transports.split(",")
+
+# uncompressed first, then compressed if asked for
+levels = [None] if args.compress is None else [None, args.compress]
+
+for transport in transports:
+    if transport not in ("tcp", "unix", "udp"):
+        parser.error("unknown transport %s" % transport)
+
+for name in args.servers.split(","):
+
+    if name not in SERVERS:
+        parser.error("unknown server %s" % name)
+
+    for transport in transports:
+
+        if transport == "unix" and name == "selector-workers":
+            # SO_REUSEPORT only works for TCP and UDP
+            print("Skipping %s over unix sockets." % name)
+
+            continue
+
+        for connections in args.clients:
+
+            if connections > 1 and not SERVERS[name][2]:
+                print("Skipping %s with %d clients." % (name, connections))
+
+                continue
+
+            for size, compress_level in itertools.product(args.sizes, levels):
+
+                if compress_level is not None and transport == "udp":
+                    continue
+
+                results = run_scenario(
+                        name, transport, connections, size, args.pipeline,
+                        args.messages, args.server_args.split(),
+                        args.payload, compress_level
+                        )
+                all_results.append(results)
+
+                segments = results["segments_per_msg"]
+
+                print(
+                        "%-32s %10.0f msg/s  p50 %7.3fms  p99 %7.3fms  "
+                        "cpu %6.2fs + %.2fs  wire %6.0f B/msg  rss %s kB%s" %
+                        (scenario_key(results), results["messages_per_sec"],
+                            results["p50_ms"], results["p99_ms"],
+                            results["cpu_seconds"],
+                            results["client_cpu_seconds"],
+                            results["bytes_sent"] / max(results["messages"], 1),
+                            results["max_rss_kb"],
+                            "  segs/msg %.2f" % segments if segments else "")
+                        )
+
+with open(args.output, "w") as output_file:
+    json.dump(
+            {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": all_results
+                },
+            output_file,
+            indent=4
+            )
+
+print("Results written to %s." % args.output)
+
+if args.baseline:
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare(all_results, baseline, args.threshold)
+
+    for regression in regressions:
+        print("REGRESSION " + regression)
+
+    if regressions:
+        sys.exit(1)
+
+    print("No regressions against %s." % args.baseline)
+# single/c1/s64/p1                  21567 msg/s  p50   0.041ms  p99   0.073ms  cpu   0.14s  rss 12560 kB
+# ...
+# Results written to results.json.
+
+# Note: To keep a baseline, copy a results file aside,
+# e.g. cp results.json baseline.json, and pass it later
+# with --baseline baseline.json
+
+# Note: --transports tcp,unix,udp --clients 1 --sizes 64
+# single/c1/s64/p1                      18720 msg/s  p50   0.049ms  p99   0.077ms
+# single+unix/c1/s64/p1                 22637 msg/s  p50   0.040ms  p99   0.067ms
+# single+udp/c1/s64/p1                  40933 msg/s  p50   0.007ms  p99   0.042ms
+# selector/c1/s64/p1                    12318 msg/s  p50   0.071ms  p99   0.139ms
+# selector+unix/c1/s64/p1               13814 msg/s  p50   0.063ms  p99   0.131ms
+
+# Note: segs/msg counts TCP segments in both directions.
+# Replies to pipelined messages (--clients 8 --pipeline 8
+# --server-args "--message-log off ..."):
+# single-threads/c8/s64/p8              66597 msg/s  p50   0.858ms  segs/msg 0.51
+# single-threads/c8/s64/p8 batch       107207 msg/s  p50   0.550ms  segs/msg 0.25
+# single-threads/c8/s64/p8 nodelay      83301 msg/s  p50   0.705ms  segs/msg 1.25
+# single-threads/c8/s64/p8 cork,batch  141212 msg/s  p50   0.433ms  segs/msg 0.25
+# selector/c8/s64/p8                    96105 msg/s  p50   0.684ms  segs/msg 0.25
+# selector/c8/s64/p8 batch             110057 msg/s  p50   0.548ms  segs/msg 0.25
+
+# Note: Compression (--payload text --compress 1) saves
+# bandwidth but costs CPU on both ends ("cpu server +
+# client"), which on loopback only makes things slower:
+# selector/c1/s4096/p1         21448 msg/s  cpu 0.20s + 0.12s  wire  4100 B/msg
+# selector+zlib1/c1/s4096/p1    9591 msg/s  cpu 0.28s + 0.30s  wire   587 B/msg
+# selector/c1/s65536/p1        10469 msg/s  cpu 0.32s + 0.21s  wire 65540 B/msg
+# selector+zlib1/c1/s65536/p1   1680 msg/s  cpu 1.01s + 1.98s  wire  8776 B/msg
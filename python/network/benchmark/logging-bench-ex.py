@@ -0,0 +1,93 @@
+# Python3 Logging Benchmark Example
+#
+# Compares what logging one received message costs the
+# server loop: the old synchronous print() against the
+# queued logger with and without sampling/rate limits
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netlog import MessageLog, setup_logging, stop_logging
+
+ADDR = ("127.0.0.1", 54321)
+
+def bench_print(out, messages, data):
+    start = time.perf_counter()
+
+    for _ in range(messages):
+        print(
+                "Got message from %s: %s" %
+                (str(ADDR), data.decode("utf-8")),
+                file=out
+                )
+
+    out.flush()
+
+    return time.perf_counter() - start, 0.0
+
+def bench_message_log(out, messages, data, **options):
+    setup_logging(out)
+    message_log = MessageLog(**options)
+
+    start = time.perf_counter()
+
+    for _ in range(messages):
+        message_log(ADDR, data)
+
+    hot_path = time.perf_counter() - start
+
+    # wait until the writer thread has caught up
+    stop_logging()
+    out.flush()
+
+    return hot_path, time.perf_counter() - start
+
+parser = argparse.ArgumentParser(description="Logging benchmark example")
+parser.add_argument("--messages", type=int, default=200000)
+parser.add_argument("--size", type=int, default=64)
+parser.add_argument(
+        "--output", default=os.devnull,
+        help="where log lines go (default: %(default)s)"
+        )
+args = parser.parse_args()
+
+data = b"x" * args.size
+
+cases = [
+        ("print (old)", lambda out: bench_print(out, args.messages, data)),
+        ("queued, all", lambda out: bench_message_log(out, args.messages, data)),
+        ("queued, 1 in 100", lambda out: bench_message_log(
+            out, args.messages, data, sample=100)),
+        ("queued, 1000/s", lambda out: bench_message_log(
+            out, args.messages, data, rate=1000)),
+        ("off", lambda out: bench_message_log(
+            out, args.messages, data, enabled=False)),
+        ]
+
+print("%d messages of %d bytes:" % (args.messages, args.size))
+
+for name, case in cases:
+
+    with open(args.output, "w") as out:
+        hot_path, total = case(out)
+
+    print(
+            "\t%-18s %7.2f us/msg on the server loop"
+            "%s" %
+            (name, hot_path / args.messages * 1e6,
+                ", %.2fs until written" % total if total else "")
+            )
+# 200000 messages of 64 bytes:
+# 	print (old)           1.87 us/msg on the server loop
+# 	queued, all           0.96 us/msg on the server loop, 0.66s until written
+# 	queued, 1 in 100      0.45 us/msg on the server loop, 0.09s until written
+# 	queued, 1000/s        1.03 us/msg on the server loop, 0.21s until written
+# 	off                   0.17 us/msg on the server loop, 0.04s until written
+
+# Note: The queued logger still has to write every line
+# eventually, it just does it on another thread; only
+# sampling, rate limits or turning it off save the work
@@ -1,28 +1,208 @@
 # Python3 Client Example
 
-import socket
+import argparse
+import json
+import sys
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+from compression import negotiate
+from compression import add_arguments as add_compression_arguments
+from fileserve import GET_COMMAND, receive_file
+from framing import FrameReader, send_frame
+from loadgen import file_payloads, generated_payloads, print_results, run_load
+from stats import STATS_COMMAND
+from transport import MAX_DATAGRAM, address, connect, is_datagram
+from transport import add_arguments as add_transport_arguments
 
-    server_address = ("127.0.0.1", 12000)
+def request(sock, reader, message, codec=None):
+    """Sends one message and returns the reply (None if closed)."""
+    if is_datagram(sock):
+        # one datagram each way, no framing
+        sock.send(message)
 
-    try:
-        sock.connect(server_address)
-        user_input = None
+        return sock.recv(MAX_DATAGRAM)
 
-        while user_input != "q":
-            user_input = input("Type in a message (q to quit): ")
+    if codec is None:
+        send_frame(sock, message)
 
-            if user_input != "q":
-                user_bytes = bytes(user_input, "utf-8")
-                sock.send(user_bytes)
-                data = sock.recv(64)
+        return reader.read_frame(sock)
 
-                print("Server response: %s" % data.decode("utf-8"))
+    send_frame(sock, codec.encode(message))
+    reply = reader.read_frame(sock)
 
-    except KeyboardInterrupt:
-        print("You could have just typed 'q'")
+    return reply if reply is None else codec.decode(reply)
 
-    finally:
-        print("Closing socket...")
-        sock.close()
+def start_compression(sock, reader, args):
+    if not args.compress:
+        return None
+
+    codec = negotiate(sock, reader, args.compress_level, args.compress_threshold)
+
+    if codec is None:
+        print("The server does not compress, sending messages as they are.")
+
+    return codec
+
+def interactive(args):
+
+    with connect(args) as sock:
+
+        try:
+            reader = FrameReader()
+            codec = start_compression(sock, reader, args)
+            user_input = None
+
+            while user_input != "q":
+                user_input = input("Type in a message (q to quit): ")
+
+                if user_input != "q":
+                    user_bytes = bytes(user_input, "utf-8")
+                    data = request(sock, reader, user_bytes, codec)
+
+                    if data is None:
+                        print("Server closed the connection.")
+
+                        break
+
+                    print("Server response: %s" % data.decode("utf-8"))
+
+        except KeyboardInterrupt:
+            print("You could have just typed 'q'")
+
+        finally:
+            print("Closing socket...")
+            sock.close()
+
+def show_stats(args):
+
+    with connect(args) as sock:
+        sock.settimeout(5)
+        reader = FrameReader()
+        codec = start_compression(sock, reader, args)
+        data = request(sock, reader, STATS_COMMAND, codec)
+
+    print(json.dumps(json.loads(data), indent=4))
+
+def get_file(args, name, byte_range, output):
+    message = GET_COMMAND + name.encode("utf-8")
+
+    if byte_range:
+        message += b" " + byte_range.encode("utf-8")
+
+    with connect(args) as sock:
+        reader = FrameReader()
+        codec = start_compression(sock, reader, args)
+        status = request(sock, reader, message, codec)
+
+        if status is None or not status.startswith(b"FILE "):
+            print("Server response: %s" % (status or b"").decode("utf-8"))
+
+            return
+
+        if output:
+            with open(output, "wb") as out:
+                receive_file(sock, reader, out)
+        else:
+            receive_file(sock, reader, sys.stdout.buffer)
+            sys.stdout.flush()
+
+parser = argparse.ArgumentParser(description="Client example")
+add_transport_arguments(parser)
+parser.add_argument(
+        "--load", action="store_true",
+        help="generate load instead of reading messages from the keyboard"
+        )
+parser.add_argument(
+        "--connections", type=int, default=1,
+        help="concurrent connections in --load mode (default: 1)"
+        )
+parser.add_argument(
+        "--pipeline", type=int, default=1,
+        help="messages in flight per connection (default: 1)"
+        )
+parser.add_argument(
+        "--messages", type=int, default=None,
+        help="total messages to send (default: 10000 unless --duration)"
+        )
+parser.add_argument(
+        "--duration", type=float, default=None,
+        help="keep sending for this many seconds"
+        )
+parser.add_argument(
+        "--size", type=int, default=64,
+        help="size of generated payloads in bytes (default: 64)"
+        )
+parser.add_argument(
+        "--payload-file",
+        help="send the lines of this file instead of generated payloads"
+        )
+parser.add_argument(
+        "--get", metavar="NAME",
+        help="download a file served by the server and exit"
+        )
+parser.add_argument(
+        "--range", metavar="START-END",
+        help="only download these bytes of the file (e.g. 0-99 or 100-)"
+        )
+parser.add_argument(
+        "--output", metavar="FILE",
+        help="write the downloaded file here instead of stdout"
+        )
+parser.add_argument(
+        "--stats", action="store_true",
+        help="print the server statistics and exit"
+        )
+add_compression_arguments(
+        parser, help="ask the server to compress messages both ways"
+        )
+args = parser.parse_args()
+
+family, sock_type, server_address = address(args)
+
+if args.get and args.transport == "udp":
+    parser.error("--get needs --transport tcp or unix")
+
+if args.compress and args.transport == "udp":
+    parser.error("--compress needs --transport tcp or unix")
+
+if args.stats:
+    show_stats(args)
+
+elif args.get:
+    get_file(args, args.get, args.range, args.output)
+
+elif not args.load:
+    interactive(args)
+
+else:
+    count = args.messages
+
+    if count is None and args.duration is None:
+        count = 10000
+
+    if args.payload_file:
+        payloads = file_payloads(args.payload_file, count)
+    else:
+        payloads = generated_payloads(args.size, count)
+
+    print_results(
+            run_load(
+                server_address,
+                connections=args.connections,
+                pipeline=args.pipeline,
+                payloads=payloads,
+                duration=args.duration,
+                family=family,
+                sock_type=sock_type,
+                compress_level=args.compress_level if args.compress else None,
+                compress_threshold=args.compress_threshold
+                )
+            )
+# 10000 messages over 1 connections (pipeline 1) in 0.56s
+# 	17924 messages/sec
+# 	latency p50 0.049ms, p99 0.095ms, p999 0.183ms
+
+# Note: Without --load the client is interactive
+# just like before, e.g. python3 client-ex.py
+
+# Note: --transport unix --path /tmp/network-ex.sock or
+# --transport udp talk to a server started the same way
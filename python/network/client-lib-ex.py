@@ -0,0 +1,100 @@
+# Python3 Client Library Example
+#
+# Sends requests to a running server with netclient.py,
+# once with a new connection per request (like running
+# client-ex.py once per message) and then over pooled
+# connections, from threads and from asyncio
+
+import argparse
+import asyncio
+import socket
+import time
+
+from framing import FrameReader, send_frame
+from netclient import AsyncClient, Client
+from transport import address
+from transport import add_arguments as add_transport_arguments
+
+def connect_per_request(server_address, requests):
+    family = socket.AF_UNIX if isinstance(server_address, str) else socket.AF_INET
+
+    for _ in range(requests):
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.connect(server_address)
+            send_frame(sock, b"hello")
+            FrameReader().read_frame(sock)
+
+def pooled(server_address, requests, in_flight):
+
+    with Client(server_address, max_in_flight=in_flight) as client:
+        futures = [client.submit(b"hello") for _ in range(requests)]
+        replies = [future.result() for future in futures]
+
+        print("\tfirst reply: %s" % replies[0].decode("utf-8"))
+        print("\tconnections opened: %d" % client.pool.opened)
+
+async def pooled_async(server_address, requests, in_flight):
+
+    async with AsyncClient(server_address, max_in_flight=in_flight) as client:
+        replies = await asyncio.gather(
+                *(client.request(b"hello") for _ in range(requests))
+                )
+        stats = await client.stats()
+
+        print("\tfirst reply: %s" % replies[0].decode("utf-8"))
+        print("\tconnections opened: %d" % client.pool.opened)
+        print("\tserver has seen %d messages" % stats["messages_in"])
+
+def timed(name, requests, function, *args):
+    print("%s:" % name)
+    start = time.perf_counter()
+
+    result = function(*args)
+
+    if asyncio.iscoroutine(result):
+        asyncio.run(result)
+
+    elapsed = time.perf_counter() - start
+    print("\t%d requests in %.2fs, %.0f requests/sec" %
+            (requests, elapsed, requests / elapsed))
+
+parser = argparse.ArgumentParser(description="Client library example")
+add_transport_arguments(parser)
+parser.add_argument("--requests", type=int, default=5000)
+parser.add_argument(
+        "--in-flight", type=int, default=16,
+        help="requests sent at once (default: 16)"
+        )
+args = parser.parse_args()
+
+if args.transport == "udp":
+    parser.error("the client library needs --transport tcp or unix")
+
+family, sock_type, server_address = address(args)
+
+timed(
+        "New connection per request", args.requests,
+        connect_per_request, server_address, args.requests
+        )
+timed(
+        "Pooled, threads", args.requests,
+        pooled, server_address, args.requests, args.in_flight
+        )
+timed(
+        "Pooled, asyncio", args.requests,
+        pooled_async, server_address, args.requests, args.in_flight
+        )
+# New connection per request:
+# 	5000 requests in 1.17s, 4270 requests/sec
+# Pooled, threads:
+# 	first reply: OK
+# 	connections opened: 16
+# 	5000 requests in 0.32s, 15585 requests/sec
+# Pooled, asyncio:
+# 	first reply: OK
+# 	connections opened: 1
+# 	server has seen 15001 messages
+# 	5000 requests in 0.24s, 20726 requests/sec
+
+# Note: The asyncio client pipelines up to 16 requests
+# on a connection before it opens another one
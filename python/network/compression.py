@@ -0,0 +1,143 @@
+# Python3 Compression Module
+#
+# A client that wants compression sends b"HELLO zlib" as
+# its first message. A server started with --compress
+# answers b"HELLO zlib", any other server b"HELLO none"
+# (or just b"OK" if it predates this).
+#
+# After b"HELLO zlib" both sides start every payload with
+# a flag byte: RAW for payloads sent as they are and
+# DEFLATE for compressed ones. Each side compresses with
+# one zlib stream per connection, flushed after every
+# message, so later messages reuse the dictionary of the
+# earlier ones. Messages below the threshold go raw.
+#
+# File data after b"FILE <length>" is never compressed,
+# it still goes out with sendfile().
+
+import zlib
+
+from framing import MAX_FRAME_SIZE, FrameError, encode_frame, send_frame
+
+HELLO_COMMAND = b"HELLO "
+ZLIB = b"zlib"
+NONE = b"none"
+
+RAW = 0
+DEFLATE = 1
+
+DEFAULT_LEVEL = 6
+DEFAULT_THRESHOLD = 256
+
+# raw deflate, the frame header already tells the length
+WBITS = -15
+
+class Codec():
+    """Compresses and decompresses the payloads of one connection."""
+
+    __slots__ = (
+            "compressor", "decompressor", "threshold",
+            "raw_bytes", "wire_bytes"
+            )
+
+    def __init__(self, level=DEFAULT_LEVEL, threshold=DEFAULT_THRESHOLD):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS)
+        self.decompressor = zlib.decompressobj(WBITS)
+        self.threshold = threshold
+
+        # payload bytes encoded and what they took on the wire
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def encode(self, payload):
+        self.raw_bytes += len(payload)
+
+        if len(payload) < self.threshold:
+            data = b"".join((b"\0", payload))
+        else:
+            # Z_SYNC_FLUSH ends the message on a byte boundary
+            # but keeps the window for the next one
+            data = b"".join((
+                    b"\1",
+                    self.compressor.compress(payload),
+                    self.compressor.flush(zlib.Z_SYNC_FLUSH)
+                    ))
+
+        self.wire_bytes += len(data)
+
+        return data
+
+    def frame(self, payload):
+        return encode_frame(self.encode(payload))
+
+    def decode(self, data):
+        if not data:
+            raise FrameError("Payload without compression flag")
+
+        if data[0] == RAW:
+            return data[1:]
+
+        if data[0] != DEFLATE:
+            raise FrameError("Unknown compression flag %d" % data[0])
+
+        try:
+            # never inflate more than a frame may hold
+            payload = self.decompressor.decompress(data[1:], MAX_FRAME_SIZE)
+
+        except zlib.error as err:
+            raise FrameError("Bad compressed payload: %s" % err)
+
+        if self.decompressor.unconsumed_tail:
+            raise FrameError(
+                    "Decompressed payload exceeds %d bytes" % MAX_FRAME_SIZE
+                    )
+
+        return payload
+
+def reply_frame(codec, payload):
+    """Frames a reply, encoded if the connection has a Codec."""
+    if codec is None:
+        return encode_frame(payload)
+
+    return codec.frame(payload)
+
+def negotiate(sock, reader, level=DEFAULT_LEVEL, threshold=DEFAULT_THRESHOLD):
+    """Asks a server for compression, returns a Codec or None.
+
+    Must be the first message on a blocking socket."""
+    send_frame(sock, HELLO_COMMAND + ZLIB)
+    reply = reader.read_frame(sock)
+
+    if reply is None:
+        raise ConnectionError("Server closed the connection")
+
+    if reply == HELLO_COMMAND + ZLIB:
+        return Codec(level, threshold)
+
+    return None
+
+def accept(request, enabled, level=DEFAULT_LEVEL, threshold=DEFAULT_THRESHOLD):
+    """Answers a HELLO request, returns (reply, Codec or None)."""
+    methods = request[len(HELLO_COMMAND):].split()
+
+    if enabled and ZLIB in methods:
+        return HELLO_COMMAND + ZLIB, Codec(level, threshold)
+
+    return HELLO_COMMAND + NONE, None
+
+def add_arguments(parser, help):
+    parser.add_argument("--compress", action="store_true", help=help)
+    parser.add_argument(
+            "--compress-level", type=int, default=DEFAULT_LEVEL,
+            choices=range(0, 10), metavar="0-9",
+            help="zlib level, 1 is fastest (default: %(default)s)"
+            )
+    parser.add_argument(
+            "--compress-threshold", type=int, default=DEFAULT_THRESHOLD,
+            metavar="BYTES",
+            help="send smaller messages uncompressed (default: %(default)s)"
+            )
+
+# Note: Once compression is on, a later HELLO is just
+# another message; the flag bytes cannot be turned off
+# again in the middle of a connection
@@ -0,0 +1,226 @@
+# Python3 File Serving Module
+#
+# A client asks for a file with a message like
+#
+#   GET crew.txt          whole file
+#   GET crew.txt 0-99     bytes 0 to 99 (inclusive)
+#   GET crew.txt 100-     from byte 100 to the end
+#
+# The server answers with two frames: b"FILE <length>" (or
+# b"ERROR <reason>") and then the data. The data frame is
+# sent with os.sendfile(), so the file is copied from the
+# page cache to the socket by the kernel; a buffered
+# read()/send() loop is used where sendfile is missing.
+
+import os
+
+from framing import HEADER, frame_header
+
+GET_COMMAND = b"GET "
+FILES_ROOT = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "storage", "files-ex"
+        )
+CHUNK_SIZE = 256 * 1024
+MAX_FILE_FRAME = 0xFFFFFFFF
+
+class FileRequestError(Exception):
+    """The request is malformed or names a file we do not serve."""
+
+def parse_range(text, size):
+    start, _, end = text.partition("-")
+
+    try:
+        start = int(start)
+        end = int(end) if end else size - 1
+
+    except ValueError:
+        raise FileRequestError("bad range %s" % text)
+
+    if start < 0 or end < start or start >= size:
+        raise FileRequestError("range %s not satisfiable" % text)
+
+    return start, min(end, size - 1) - start + 1
+
+def open_request(payload, root=FILES_ROOT):
+    """Opens the requested file, returns (file, offset, count)."""
+    try:
+        parts = payload[len(GET_COMMAND):].decode("utf-8").split()
+
+    except UnicodeDecodeError:
+        raise FileRequestError("bad file name")
+
+    if len(parts) not in (1, 2):
+        raise FileRequestError("expected GET <name> [<start>-<end>]")
+
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, parts[0]))
+
+    # no ../ or symlinks out of the served directory
+    if os.path.commonpath((root, path)) != root or not os.path.isfile(path):
+        raise FileRequestError("no such file %s" % parts[0])
+
+    try:
+        file = open(path, "rb")
+
+    except OSError as err:
+        raise FileRequestError("cannot open %s: %s" % (parts[0], err.strerror))
+
+    size = os.fstat(file.fileno()).st_size
+
+    try:
+        if len(parts) == 2:
+            offset, count = parse_range(parts[1], size)
+        else:
+            offset, count = 0, size
+
+        if count > MAX_FILE_FRAME:
+            raise FileRequestError("file too large")
+
+    except FileRequestError:
+        file.close()
+        raise
+
+    return file, offset, count
+
+def status_frame(count):
+    return b"FILE %d" % count
+
+def error_frame(err):
+    return b"ERROR " + str(err).encode("utf-8")
+
+class FileSender():
+    """Sends one data frame from a file on a non-blocking socket.
+
+    Sits in a connection's output queue between the replies
+    queued before and after it; send() is called again
+    whenever the socket is writable until done() is True."""
+
+    __slots__ = ("file", "offset", "remaining", "header", "use_sendfile")
+
+    def __init__(self, file, offset, count, use_sendfile=True):
+        self.file = file
+        self.offset = offset
+        self.remaining = count
+        self.header = memoryview(frame_header(count, MAX_FILE_FRAME))
+        self.use_sendfile = use_sendfile and hasattr(os, "sendfile")
+
+    def __len__(self):
+        return len(self.header) + self.remaining
+
+    def done(self):
+        return not self.header and not self.remaining
+
+    def send(self, sock):
+        """Sends as much as the socket takes, returns bytes sent."""
+        sent = 0
+
+        if self.header:
+            sent = sock.send(self.header)
+            self.header = self.header[sent:]
+
+            if self.header:
+                return sent
+
+        while self.remaining:
+            try:
+                if self.use_sendfile:
+                    chunk = os.sendfile(
+                            sock.fileno(), self.file.fileno(),
+                            self.offset, min(self.remaining, CHUNK_SIZE)
+                            )
+                else:
+                    data = os.pread(
+                            self.file.fileno(),
+                            min(self.remaining, CHUNK_SIZE),
+                            self.offset
+                            )
+                    chunk = sock.send(data) if data else 0
+
+            except BlockingIOError:
+                break
+
+            except ConnectionError:
+                raise
+
+            except OSError:
+                # e.g. a file system without sendfile support
+                if not self.use_sendfile:
+                    raise
+
+                self.use_sendfile = False
+
+                continue
+
+            if not chunk:
+                raise ConnectionError("file shrank while sending")
+
+            self.offset += chunk
+            self.remaining -= chunk
+            sent += chunk
+
+        if self.done():
+            self.file.close()
+
+        return sent
+
+    def close(self):
+        self.file.close()
+
+def send_file(sock, file, offset, count, use_sendfile=True):
+    """Sends one data frame from a file on a blocking socket."""
+    sock.sendall(frame_header(count, MAX_FILE_FRAME))
+
+    if use_sendfile:
+        # falls back to read()/send() by itself
+        sock.sendfile(file, offset, count)
+
+        return
+
+    buffer = bytearray(min(count, CHUNK_SIZE) or 1)
+    view = memoryview(buffer)
+
+    file.seek(offset)
+
+    while count:
+        read = file.readinto(view[:min(count, len(buffer))])
+
+        if not read:
+            raise ConnectionError("file shrank while sending")
+
+        sock.sendall(view[:read])
+        count -= read
+
+def receive_file(sock, reader, out):
+    """Writes the next data frame to out without holding it in memory."""
+    while reader.pending() < HEADER.size:
+        if not reader.recv_into(sock):
+            raise ConnectionError("Server closed the connection")
+
+    remaining = reader.begin_frame()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    # first whatever the reader has buffered already
+    data = reader.take(remaining)
+    out.write(data)
+    remaining -= len(data)
+
+    while remaining:
+        received = sock.recv_into(view[:min(remaining, len(buffer))])
+
+        if not received:
+            raise ConnectionError("Server closed the connection")
+
+        out.write(view[:received])
+        remaining -= received
+
+def add_arguments(parser):
+    parser.add_argument(
+            "--files-root", default=FILES_ROOT,
+            help="directory served to GET requests (default: %(default)s)"
+            )
+    parser.add_argument(
+            "--no-sendfile", action="store_true",
+            help="always use the buffered read()/send() path"
+            )
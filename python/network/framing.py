@@ -0,0 +1,188 @@
+# Python3 Message Framing Module
+#
+# Every message is sent as a 4-byte big-endian length
+# followed by that many bytes of payload:
+#
+#   +--------+--------+--------+--------+-------------...
+#   |        payload length (uint32)    |  payload
+#   +--------+--------+--------+--------+-------------...
+
+import struct
+
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+BUFFER_SIZE = 64 * 1024
+
+class FrameError(Exception):
+    """Raised when a peer announces a frame larger than allowed."""
+
+def frame_header(length, max_size=MAX_FRAME_SIZE):
+    if length > max_size:
+        raise FrameError(
+                "Frame of %d bytes exceeds limit of %d bytes" %
+                (length, max_size)
+                )
+
+    return HEADER.pack(length)
+
+def encode_frame(payload, max_size=MAX_FRAME_SIZE):
+    return b"".join((frame_header(len(payload), max_size), payload))
+
+def send_frame(sock, payload, max_size=MAX_FRAME_SIZE):
+    sock.sendall(encode_frame(payload, max_size))
+
+class FrameReader():
+    """Splits a received byte stream into frames.
+
+    Data is received straight into one preallocated bytearray
+    (see recv_into() and get_buffer()/advance()) and frames
+    are parsed in place through a memoryview of it."""
+
+    def __init__(self, max_size=MAX_FRAME_SIZE, buffer_size=BUFFER_SIZE):
+        self.max_size = max_size
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first byte not parsed yet
+        self.end = 0    # one past the last received byte
+
+    def pending(self):
+        return self.end - self.start
+
+    def _reserve(self, size):
+        # make room for at least size more bytes after self.end
+        if len(self.buffer) - self.end >= size:
+            return
+
+        pending = self.end - self.start
+
+        if pending + size <= len(self.buffer):
+            # move the unparsed tail to the front
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            buffer = bytearray(max(pending + size, 2 * len(self.buffer)))
+            buffer[:pending] = self.view[self.start:self.end]
+
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+
+        self.start = 0
+        self.end = pending
+
+    def get_buffer(self):
+        """Returns a writable view of the free part of the buffer."""
+        pending = self.end - self.start
+        needed = 1
+
+        if pending >= HEADER.size:
+            length, = HEADER.unpack_from(self.buffer, self.start)
+            length = min(length, self.max_size)
+            needed = HEADER.size + length - pending
+
+            # the length is only what the peer claims: the
+            # buffer grows with what has arrived, at most to
+            # twice that, not to the whole frame at once
+            needed = min(needed, max(self.buffer_size, 2 * pending) - pending)
+
+        self._reserve(max(needed, self.buffer_size // 4))
+
+        return self.view[self.end:]
+
+    def advance(self, nbytes):
+        """Marks nbytes written into get_buffer() as received."""
+        self.end += nbytes
+
+    def feed(self, data):
+        self._reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def recv_into(self, sock):
+        """Receives once from sock, returns the number of bytes read."""
+        nbytes = sock.recv_into(self.get_buffer())
+        self.advance(nbytes)
+
+        return nbytes
+
+    def next_frame(self):
+        """Returns the next complete payload or None."""
+        if self.end - self.start < HEADER.size:
+            return None
+
+        length, = HEADER.unpack_from(self.buffer, self.start)
+
+        if length > self.max_size:
+            raise FrameError(
+                    "Frame of %d bytes exceeds limit of %d bytes" %
+                    (length, self.max_size)
+                    )
+
+        frame_start = self.start + HEADER.size
+        frame_end = frame_start + length
+
+        if frame_end > self.end:
+            return None
+
+        payload = bytes(self.view[frame_start:frame_end])
+
+        self.start = frame_end
+
+        if self.start == self.end:
+            self.start = self.end = 0
+
+            # give back the memory of a large frame
+            if len(self.buffer) > 4 * self.buffer_size:
+                self.buffer = bytearray(self.buffer_size)
+                self.view = memoryview(self.buffer)
+
+        return payload
+
+    def begin_frame(self):
+        """Consumes the next frame header only, returns its length.
+
+        For payloads too large to buffer: the caller reads
+        them with take() and then straight from the socket."""
+        if self.end - self.start < HEADER.size:
+            return None
+
+        length, = HEADER.unpack_from(self.buffer, self.start)
+        self.start += HEADER.size
+
+        return length
+
+    def take(self, limit):
+        """Consumes up to limit buffered bytes that are not parsed yet."""
+        end = min(self.end, self.start + limit)
+        data = bytes(self.view[self.start:end])
+
+        self.start = end
+
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        return data
+
+    def frames(self):
+        """Yields every complete payload received so far."""
+        while True:
+            payload = self.next_frame()
+
+            if payload is None:
+                break
+
+            yield payload
+
+    def read_frame(self, sock):
+        """Blocks until a whole frame arrived, None on EOF."""
+        while True:
+            payload = self.next_frame()
+
+            if payload is not None:
+                return payload
+
+            if not self.recv_into(sock):
+                return None
+
+# Note: The 4-byte header keeps message boundaries
+# intact no matter how TCP splits or merges segments
@@ -0,0 +1,167 @@
+# Python3 Request Handler Module
+#
+# The selector server hands the messages it has received
+# to a handler in batches: every complete message read in
+# one select() round goes into one handle() call, so a
+# handler can do its work once per batch (one write() for
+# all of them, one database round trip, ...).
+#
+# A handler is a class with a handle(messages) method,
+# where messages is a list of (address, payload) tuples,
+# returning a list with one reply payload per message.
+# Pick one with --handler NAME, or --handler module:Class
+# for a class of your own.
+#
+# CPU-heavy handlers can run on a thread or process pool
+# (--offload thread|process) so the event loop keeps
+# serving other clients meanwhile.
+
+import concurrent.futures
+import hashlib
+import importlib
+import multiprocessing
+import os
+
+class Handler():
+    """Replies b"OK" to every message."""
+
+    def handle(self, messages):
+        return [b"OK"] * len(messages)
+
+    def close(self):
+        pass
+
+class EchoHandler(Handler):
+    """Sends every payload back."""
+
+    def handle(self, messages):
+        return [payload for _, payload in messages]
+
+class AppendHandler(Handler):
+    """Appends the payloads to a file, one line each.
+
+    All messages of a batch are written with a single
+    write(), instead of one write() per message."""
+
+    PATH = "messages.log"
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("MESSAGES_LOG", self.PATH)
+        self.file = open(self.path, "ab", buffering=0)
+
+    def handle(self, messages):
+        self.file.write(b"".join(payload + b"\n" for _, payload in messages))
+
+        return [b"OK"] * len(messages)
+
+    def close(self):
+        self.file.close()
+
+class HashHandler(Handler):
+    """Replies with a slow hash of every payload (a CPU-heavy example)."""
+
+    ROUNDS = 1000
+
+    def handle(self, messages):
+        replies = []
+
+        for _, payload in messages:
+            digest = payload
+
+            for _ in range(self.ROUNDS):
+                digest = hashlib.sha256(digest).digest()
+
+            replies.append(digest.hex().encode("ascii"))
+
+        return replies
+
+HANDLERS = {
+        "ok": Handler,
+        "echo": EchoHandler,
+        "append": AppendHandler,
+        "hash": HashHandler,
+        }
+
+OFFLOAD = ("none", "thread", "process")
+
+def load_handler(spec):
+    """Returns a new handler for a name in HANDLERS or a module:Class spec."""
+    if spec in HANDLERS:
+        return HANDLERS[spec]()
+
+    module_name, _, class_name = spec.partition(":")
+
+    if not class_name:
+        raise ValueError(
+                "unknown handler %s, expected one of %s or module:Class" %
+                (spec, ", ".join(HANDLERS))
+                )
+
+    return getattr(importlib.import_module(module_name), class_name)()
+
+# Note: A process pool cannot share our handler object,
+# every worker process creates its own in start_worker()
+
+worker_handler = None
+
+def start_worker(spec):
+    global worker_handler
+
+    worker_handler = load_handler(spec)
+
+def handle_in_worker(messages):
+    return worker_handler.handle(messages)
+
+class Dispatcher():
+    """Calls a handler inline or on a pool, see submit()."""
+
+    def __init__(self, spec, offload="none", workers=None):
+        self.handler = load_handler(spec)
+        self.executor = None
+
+        if offload == "thread":
+            # one handler object shared by the threads
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=workers or 1,
+                    thread_name_prefix="handler"
+                    )
+        elif offload == "process":
+            # forked from a clean process, a plain fork would
+            # inherit the listening socket and keep it open
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                    initializer=start_worker,
+                    initargs=(spec,)
+                    )
+
+    def submit(self, messages):
+        """Returns the replies, or a Future of them if offloaded."""
+        if self.executor is None:
+            return self.handler.handle(messages)
+
+        if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+            return self.executor.submit(handle_in_worker, messages)
+
+        return self.executor.submit(self.handler.handle, messages)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+        self.handler.close()
+
+def add_arguments(parser):
+    parser.add_argument(
+            "--handler", default="ok",
+            help="request handler: %s or module:Class (default: ok)" %
+                ", ".join(HANDLERS)
+            )
+    parser.add_argument(
+            "--offload", choices=OFFLOAD, default="none",
+            help="run the handler on a thread or process pool (default: none)"
+            )
+    parser.add_argument(
+            "--offload-workers", type=int, default=None, metavar="N",
+            help="size of the --offload pool"
+            )
@@ -0,0 +1,374 @@
+# Python3 Load Generator Module
+#
+# Opens a number of connections to a server and keeps a
+# fixed number of framed messages in flight on each one,
+# measuring the round-trip time of every reply. Over UDP
+# every message is one datagram and replies that do not
+# come back within DATAGRAM_TIMEOUT are counted as lost.
+
+import collections
+import itertools
+import json
+import random
+import selectors
+import socket
+import time
+
+from array import array
+
+from compression import DEFAULT_THRESHOLD, negotiate
+from framing import FrameReader, encode_frame
+
+DATAGRAM_TIMEOUT = 1.0
+
+def generated_payloads(size, count=None):
+    payload = b"x" * size
+
+    if count is None:
+        return itertools.repeat(payload)
+
+    return itertools.repeat(payload, count)
+
+def text_payloads(size, count=None, variants=16, seed=1):
+    """Yields JSON records of size bytes, compressible like real data.
+
+    A few different payloads are made up front and repeated,
+    so generating them does not slow down the load."""
+    rnd = random.Random(seed)
+    names = ("Picard", "Riker", "Data", "Worf", "Troi", "Crusher", "La Forge")
+    pool = []
+
+    for _ in range(variants):
+        parts = []
+        length = 0
+
+        while length < size:
+            part = json.dumps({
+                    "officer": rnd.choice(names),
+                    "deck": rnd.randrange(1, 43),
+                    "stardate": round(rnd.uniform(41000, 48000), 1),
+                    "status": rnd.choice(("on duty", "off duty", "away team"))
+                    })
+            parts.append(part)
+            length += len(part) + 2
+
+        pool.append(("[" + ", ".join(parts) + "]").encode("utf-8")[:size])
+
+    payloads = itertools.cycle(pool)
+
+    if count is None:
+        return payloads
+
+    return itertools.islice(payloads, count)
+
+def file_payloads(path, count=None):
+    """Yields one payload per line of the file, repeating it if needed."""
+    sent = 0
+
+    while count is None or sent < count:
+        empty = True
+
+        with open(path, "rb") as payload_file:
+            for line in payload_file:
+                empty = False
+
+                yield line.rstrip(b"\n")
+                sent += 1
+
+                if count is not None and sent >= count:
+                    return
+
+        if empty:
+            return
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+
+    return sorted_values[index]
+
+class LoadConnection():
+    """One client connection with its messages in flight."""
+
+    def __init__(self, sock, reader=None, codec=None):
+        self.sock = sock
+        self.reader = reader or FrameReader()
+        self.codec = codec
+        self.outb = bytearray()
+        self.sent_at = collections.deque()
+
+def fill_pipeline(conn, payloads, pipeline):
+    """Queues messages up to the pipeline depth, returns how many."""
+    queued = 0
+
+    while len(conn.sent_at) < pipeline:
+        payload = next(payloads, None)
+
+        if payload is None:
+            break
+
+        if conn.codec is not None:
+            payload = conn.codec.encode(payload)
+
+        conn.outb += encode_frame(payload)
+        conn.sent_at.append(time.perf_counter())
+        queued += 1
+
+    return queued
+
+def run_load(server_address, connections=1, pipeline=1, payloads=None,
+        duration=None, family=socket.AF_INET, sock_type=socket.SOCK_STREAM,
+        compress_level=None, compress_threshold=DEFAULT_THRESHOLD):
+    """Drives the server and returns a dictionary of results.
+
+    With a compress_level every connection asks the server
+    for compression before the load starts."""
+
+    if sock_type == socket.SOCK_DGRAM:
+        return run_datagram_load(
+                server_address, connections, pipeline, payloads,
+                duration, family
+                )
+
+    if payloads is None:
+        payloads = generated_payloads(64, 1000)
+
+    payloads = iter(payloads)
+    sel = selectors.DefaultSelector()
+    latencies = array("d")
+    bytes_sent = 0
+
+    for _ in range(connections):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(server_address)
+        reader = FrameReader()
+        codec = None
+
+        if compress_level is not None:
+            codec = negotiate(sock, reader, compress_level, compress_threshold)
+
+            if codec is None:
+                raise ConnectionError("The server does not compress")
+
+        sock.setblocking(False)
+
+        sel.register(
+                sock, selectors.EVENT_READ, LoadConnection(sock, reader, codec)
+                )
+
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+    more = True
+    in_flight = 0
+
+    for key in list(sel.get_map().values()):
+        in_flight += fill_pipeline(key.data, payloads, pipeline)
+        sel.modify(key.fileobj, selectors.EVENT_READ | selectors.EVENT_WRITE, key.data)
+
+    while in_flight:
+
+        if deadline and more and time.perf_counter() >= deadline:
+            # stop sending, but wait for replies in flight
+            more = False
+
+        for key, mask in sel.select(timeout=1):
+            conn = key.data
+
+            if mask & selectors.EVENT_WRITE and conn.outb:
+                try:
+                    sent = conn.sock.send(conn.outb)
+
+                except BlockingIOError:
+                    sent = 0
+
+                del conn.outb[:sent]
+                bytes_sent += sent
+
+            if mask & selectors.EVENT_READ:
+                if not conn.reader.recv_into(conn.sock):
+                    raise ConnectionError("Server closed the connection")
+
+                now = time.perf_counter()
+
+                for _ in conn.reader.frames():
+                    latencies.append(now - conn.sent_at.popleft())
+                    in_flight -= 1
+
+                if more:
+                    queued = fill_pipeline(conn, payloads, pipeline)
+                    in_flight += queued
+
+                    # the payloads ran out
+                    if len(conn.sent_at) < pipeline:
+                        more = False
+
+            events = selectors.EVENT_READ
+
+            if conn.outb:
+                events |= selectors.EVENT_WRITE
+
+            if key.events != events:
+                sel.modify(conn.sock, events, conn)
+
+    elapsed = time.perf_counter() - start
+    payload_bytes = 0
+
+    for key in list(sel.get_map().values()):
+        if key.data.codec is not None:
+            payload_bytes += key.data.codec.raw_bytes
+
+        sel.unregister(key.fileobj)
+        key.fileobj.close()
+
+    sel.close()
+
+    results = load_results(connections, pipeline, latencies, bytes_sent, elapsed)
+
+    if compress_level is not None:
+        results["payload_bytes"] = payload_bytes
+
+    return results
+
+def load_results(connections, pipeline, latencies, bytes_sent, elapsed, lost=0):
+    ordered = sorted(latencies)
+
+    return {
+            "connections": connections,
+            "pipeline": pipeline,
+            "messages": len(ordered),
+            "bytes_sent": bytes_sent,
+            "seconds": elapsed,
+            "messages_per_sec": len(ordered) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "p999_ms": percentile(ordered, 99.9) * 1000,
+            "lost": lost,
+            }
+
+def run_datagram_load(server_address, connections=1, pipeline=1,
+        payloads=None, duration=None, family=socket.AF_INET):
+    """Like run_load(), but each message is one UDP datagram."""
+
+    if payloads is None:
+        payloads = generated_payloads(64, 1000)
+
+    payloads = iter(payloads)
+    sel = selectors.DefaultSelector()
+    latencies = array("d")
+    buffer = bytearray(65535)
+    bytes_sent = 0
+    lost = 0
+
+    for _ in range(connections):
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.connect(server_address)
+        sock.setblocking(False)
+
+        # sent_at holds the send times of messages in flight
+        sel.register(sock, selectors.EVENT_READ, collections.deque())
+
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+    more = True
+    in_flight = 0
+
+    def send_more(sock, sent_at):
+        nonlocal bytes_sent, in_flight, more
+
+        while more and len(sent_at) < pipeline:
+            payload = next(payloads, None)
+
+            if payload is None:
+                more = False
+
+                break
+
+            try:
+                bytes_sent += sock.send(payload)
+
+            except BlockingIOError:
+                break
+
+            sent_at.append(time.perf_counter())
+            in_flight += 1
+
+    for key in list(sel.get_map().values()):
+        send_more(key.fileobj, key.data)
+
+    while in_flight:
+
+        if deadline and more and time.perf_counter() >= deadline:
+            more = False
+
+        for key, mask in sel.select(timeout=DATAGRAM_TIMEOUT / 10):
+            sock, sent_at = key.fileobj, key.data
+
+            # read every reply that is ready
+            while sent_at:
+                try:
+                    sock.recv_into(buffer)
+
+                except BlockingIOError:
+                    break
+
+                except ConnectionRefusedError:
+                    raise ConnectionError("Nothing listens on the server address")
+
+                latencies.append(time.perf_counter() - sent_at.popleft())
+                in_flight -= 1
+
+            send_more(sock, sent_at)
+
+        # datagrams are not resent, late ones count as lost
+        expired = time.perf_counter() - DATAGRAM_TIMEOUT
+
+        for key in list(sel.get_map().values()):
+            sent_at = key.data
+
+            while sent_at and sent_at[0] < expired:
+                sent_at.popleft()
+                in_flight -= 1
+                lost += 1
+
+            send_more(key.fileobj, sent_at)
+
+    elapsed = time.perf_counter() - start
+
+    for key in list(sel.get_map().values()):
+        sel.unregister(key.fileobj)
+        key.fileobj.close()
+
+    sel.close()
+
+    return load_results(
+            connections, pipeline, latencies, bytes_sent, elapsed, lost
+            )
+
+def print_results(results):
+    print(
+            "%d messages over %d connections (pipeline %d) in %.2fs" %
+            (results["messages"], results["connections"],
+                results["pipeline"], results["seconds"])
+            )
+    print("\t%.0f messages/sec" % results["messages_per_sec"])
+
+    if results.get("lost"):
+        print("\t%d messages lost" % results["lost"])
+
+    if results.get("payload_bytes"):
+        print(
+                "\t%d payload bytes sent as %d bytes (%.1f%%)" %
+                (results["payload_bytes"], results["bytes_sent"],
+                    results["bytes_sent"] / results["payload_bytes"] * 100)
+                )
+
+    print(
+            "\tlatency p50 %.3fms, p99 %.3fms, p999 %.3fms" %
+            (results["p50_ms"], results["p99_ms"], results["p999_ms"])
+            )
+
+# Note: The servers answer in order on every connection,
+# so the oldest send timestamp belongs to the next reply;
+# on loopback that holds for UDP replies too
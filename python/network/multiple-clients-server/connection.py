@@ -0,0 +1,149 @@
+# Python3 Connection Buffer Module
+
+import collections
+import itertools
+import os
+
+from framing import FrameReader
+from transport import uncork
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+# Note: Each connection starts with a small receive
+# buffer; FrameReader grows it only for large frames
+
+RECV_BUFFER_SIZE = 4096
+
+class Connection():
+    """Receive and send buffers of one client connection.
+
+    Incoming data is received with recv_into() into the
+    preallocated FrameReader buffer. Outgoing data is kept
+    as a deque of memoryviews, so queueing a reply never
+    copies it, and flush() sends many of them at once with
+    sendmsg() (scatter/gather). A corked connection is
+    uncorked whenever the queue has been sent completely."""
+
+    __slots__ = (
+            "sock", "addr", "inb", "outq", "out_bytes", "files",
+            "last_active", "idle_timer", "read_timer", "cork", "codec"
+            )
+
+    def __init__(self, sock, addr, cork=False):
+        self.sock = sock
+        self.addr = addr
+        self.inb = FrameReader(buffer_size=RECV_BUFFER_SIZE)
+        self.outq = collections.deque()
+        self.out_bytes = 0
+        self.files = 0
+        self.last_active = 0.0
+        self.idle_timer = None
+        self.read_timer = None
+        self.cork = cork
+        self.codec = None
+
+    def recv(self):
+        """Receives into the frame buffer, returns the number of bytes."""
+        return self.inb.recv_into(self.sock)
+
+    def queue(self, data):
+        view = memoryview(data)
+
+        if view:
+            self.outq.append(view)
+            self.out_bytes += len(view)
+
+    def queue_file(self, sender):
+        """Queues a fileserve.FileSender behind the queued replies."""
+        self.outq.append(sender)
+        self.out_bytes += len(sender)
+        self.files += 1
+
+    def flush(self):
+        """Sends queued data, returns the number of bytes still queued."""
+        if not self.outq:
+            return 0
+
+        if self.files:
+            return self.flush_files()
+
+        try:
+            if hasattr(self.sock, "sendmsg"):
+                sent = self.sock.sendmsg(itertools.islice(self.outq, IOV_MAX))
+            else:
+                sent = self.sock.send(self.outq[0])
+
+        except BlockingIOError:
+            return self.out_bytes
+
+        self.out_bytes -= sent
+
+        while sent:
+            head = self.outq[0]
+
+            if len(head) <= sent:
+                self.outq.popleft()
+                sent -= len(head)
+            else:
+                # partially sent, keep the rest
+                self.outq[0] = head[sent:]
+                sent = 0
+
+        if self.cork and not self.out_bytes:
+            uncork(self.sock)
+
+        return self.out_bytes
+
+    def flush_files(self):
+        # slow path: the queue holds file senders too
+        while self.outq:
+            head = self.outq[0]
+
+            if type(head) is memoryview:
+                try:
+                    sent = self.sock.send(head)
+
+                except BlockingIOError:
+                    break
+
+                self.out_bytes -= sent
+
+                if sent < len(head):
+                    self.outq[0] = head[sent:]
+
+                    break
+
+                self.outq.popleft()
+
+                continue
+
+            try:
+                sent = head.send(self.sock)
+
+            except BlockingIOError:
+                break
+
+            self.out_bytes -= sent
+
+            if not head.done():
+                break
+
+            self.outq.popleft()
+            self.files -= 1
+
+        if self.cork and not self.out_bytes:
+            uncork(self.sock)
+
+        return self.out_bytes
+
+    def close(self):
+        for item in self.outq:
+            if type(item) is not memoryview:
+                item.close()
+
+        self.outq.clear()
+        self.sock.close()
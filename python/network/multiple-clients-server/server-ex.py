@@ -1,94 +1,744 @@
 # Python3 server example
 
+import argparse
+import collections
+import errno
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import os
 import socket
+import sys
 import time
 import selectors
-import types
+import signal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import HELLO_COMMAND, accept, reply_frame
+from compression import add_arguments as add_compression_arguments
+from connection import Connection
+from fileserve import (
+        FILES_ROOT, GET_COMMAND, FileRequestError, FileSender,
+        error_frame, open_request, status_frame
+        )
+from fileserve import add_arguments as add_file_arguments
+from framing import FrameError, encode_frame
+from handlers import Dispatcher
+from handlers import add_arguments as add_handler_arguments
+from netlog import (
+        add_arguments, message_log_from_args, setup_logging, stop_logging
+        )
+from stats import STATS_COMMAND, ServerStats
+from timer_wheel import TimerWheel
+from transport import (
+        DATAGRAM_BATCH, MAX_DATAGRAM, bind_socket, close_socket, corked,
+        inherited_socket, is_datagram, tune_socket
+        )
+from transport import add_arguments as add_transport_arguments
+
+OK_FRAME = encode_frame(b"OK")
+WAKE = "wake"
+
+# Note: In --workers mode every worker owns two slots of
+# a shared array: open connections and accepted connections
+
+REPORT_INTERVAL = 10
+ACCEPT_PAUSE = 1
+STOP_TIMEOUT = 5
+
+counters = None
+worker_index = 0
+
+# Note: Clients that send nothing for idle_timeout seconds,
+# or take longer than read_timeout seconds to send a whole
+# frame, are disconnected (0 turns a timeout off)
+
+idle_timeout = 300
+read_timeout = 30
+
+log = None
+message_log = None
+
+files_root = FILES_ROOT
+use_sendfile = True
+
+# Note: Messages read in one select() round are collected
+# in batch and handed to the handler together at the end
+# of the round. Offloaded batches wait in in_flight, their
+# replies are queued in the order the batches were sent.
+# A connection is flushed right after the replies to what
+# it sent in one read, or with --batch-replies once at the
+# end of the loop iteration, together with all the others.
+
+server_args = None
+dispatcher = None
+batch = []
+in_flight = collections.deque()
+pending_flush = {}
+wake_r = wake_w = None
+
+# Note: SIGTERM only sets stopping and wakes up select()
+# through wake_w; the loop then returns between two
+# iterations, never in the middle of a handler or pool call
+
+stopping = False
+
+def count_conn(opened):
+    if opened:
+        stats.accepted += 1
+    else:
+        stats.closed += 1
+
+    if counters is None:
+        return
+
+    if opened:
+        counters[2 * worker_index] += 1
+        counters[2 * worker_index + 1] += 1
+    else:
+        counters[2 * worker_index] -= 1
 
 def accept_conn(sock):
-    conn, addr = sock.accept()
+    try:
+        conn, addr = sock.accept()
+
+    except (BlockingIOError, ConnectionAbortedError):
+        # another worker was faster, or the client gave up
+        return None
+
+    except OSError as err:
+        if err.errno not in (errno.EMFILE, errno.ENFILE):
+            raise
+
+        log.info("Cannot accept connections: %s", err)
+        pause_accept(sock)
+
+        return None
+
     conn.setblocking(False)
+    tune_socket(conn, server_args)
 
-    print(
-            "Accepted connection from: %s" %
-            str(addr)
-            )
+    if not addr:
+        # unix socket clients have no address
+        addr = "unix client %d" % conn.fileno()
 
-    sel.register(
+    count_conn(True)
+
+    log.info("Accepted connection from: %s", addr)
+
+    # Note: Only EVENT_READ here; EVENT_WRITE is armed
+    # while there are pending replies, otherwise select()
+    # would return immediately for every idle connection
+
+    key = sel.register(
             conn,
-            selectors.EVENT_READ | selectors.EVENT_WRITE,
-            types.SimpleNamespace(addr=addr, inb=b'', outb=b'')
+            selectors.EVENT_READ,
+            Connection(conn, addr, corked(conn, server_args))
             )
 
+    key.data.last_active = time.monotonic()
+
+    if idle_timeout:
+        key.data.idle_timer = timers.schedule(
+                idle_timeout,
+                lambda: check_idle(key)
+                )
+
     return addr
 
-def process_data(key, mask, addr, sel):
-    sock = key.fileobj
+def pause_accept(sock):
+    # out of file descriptors: the listening socket stays
+    # readable, stop selecting it until some have been freed
+    sel.unregister(sock)
+    timers.schedule(
+            ACCEPT_PAUSE,
+            lambda: sel.register(sock, selectors.EVENT_READ, data=None)
+            )
+
+def check_idle(key):
+    conn = key.data
+    idle = time.monotonic() - conn.last_active
 
-    if mask & selectors.EVENT_READ:
-        data = sock.recv(64)
+    # the timer is not moved on every message, instead
+    # it is rescheduled here if the client was active
+    if idle < idle_timeout:
+        conn.idle_timer = timers.schedule(
+                idle_timeout - idle,
+                lambda: check_idle(key)
+                )
+    else:
+        conn.idle_timer = None
+        log.info("Connection to %s is idle.", conn.addr)
+        close_conn(key, sel)
+
+def check_read(key):
+    key.data.read_timer = None
+
+    log.info("Read from %s timed out.", key.data.addr)
+    close_conn(key, sel)
+
+def watch_read(key, completed=False):
+    conn = key.data
+
+    # the timeout counts from the start of the frame being
+    # read, not from when the buffer was last empty
+    if completed and conn.read_timer is not None:
+        timers.cancel(conn.read_timer)
+        conn.read_timer = None
 
-        if data:
-            print(
-                    "Got message from %s: %s" %
-                    (str(addr), data.decode("utf-8"))
+    if conn.inb.pending():
+        # a frame has been started but not finished
+        if conn.read_timer is None:
+            conn.read_timer = timers.schedule(
+                    read_timeout,
+                    lambda: check_read(key)
                     )
-            key.data.outb += data
 
-        else:
-            print(
-                    "Closing connection to %s..." %
-                    str(addr)
+    elif conn.read_timer is not None:
+        timers.cancel(conn.read_timer)
+        conn.read_timer = None
+
+def close_conn(key, sel):
+    log.info("Closing connection to %s...", key.data.addr)
+    pending_flush.pop(key.fd, None)
+    timers.cancel(key.data.idle_timer)
+    timers.cancel(key.data.read_timer)
+
+    sel.unregister(key.fileobj)
+    key.data.close()
+    count_conn(False)
+
+def flush_data(key, sel):
+    queued = key.data.out_bytes
+
+    try:
+        # may send only part of the queued replies
+        pending = key.data.flush()
+
+    except ConnectionError:
+        close_conn(key, sel)
+
+        return
+
+    stats.bytes_out += queued - pending
+
+    if pending:
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE
+    else:
+        events = selectors.EVENT_READ
+
+    if key.events != events:
+        sel.modify(key.fileobj, events, key.data)
+
+def dispatch_batch():
+    global batch
+
+    messages = [
+            (key.data.addr, data) for key, data, reply in batch
+            if reply is None and is_plain(data)
+            ]
+    entries, batch = batch, []
+
+    submit(messages, lambda replies: deliver(entries, replies))
+
+def is_plain(data):
+    # anything but a command the server answers itself
+    return data != STATS_COMMAND and not data.startswith(GET_COMMAND)
+
+def submit(messages, done):
+    """Runs the handler on messages, then done(replies).
+
+    While batches are in flight, done() is only called by
+    collect_replies(), after those batches are done."""
+    try:
+        result = dispatcher.submit(messages) if messages else []
+
+        if not isinstance(result, concurrent.futures.Future):
+            result = check_replies(result, len(messages))
+
+    except Exception as err:
+        log.info("Handler failed: %s", err)
+        result = [error_frame(err)] * len(messages)
+
+    if isinstance(result, list):
+        if not in_flight:
+            done(result)
+
+            return
+
+        # replies must not overtake an offloaded batch,
+        # even those of a batch the handler never saw
+        future = concurrent.futures.Future()
+        future.set_result(result)
+        result = future
+    else:
+        result.add_done_callback(wake_loop)
+
+    in_flight.append((result, done, len(messages)))
+
+def check_replies(replies, count):
+    """Returns the replies of a handler as a list, raises
+    ValueError unless there is one payload per message."""
+    replies = list(replies)
+
+    if len(replies) != count:
+        raise ValueError(
+                "handler returned %d replies for %d messages" %
+                (len(replies), count)
+                )
+
+    for payload in replies:
+        if not isinstance(payload, (bytes, bytearray)):
+            raise ValueError(
+                    "handler returned %s instead of bytes" %
+                    type(payload).__name__
                     )
-            sel.unregister(sock)
-            sock.close()
 
-    elif mask & selectors.EVENT_WRITE:
+    return replies
 
-        if key.data.outb:
-            key.fileobj.send(b"OK")
-            key.data.outb = b""
+def wake_loop(future):
+    # called on a pool thread, select() is waiting for us
+    try:
+        wake_w.send(b"\0")
 
-def start_server(sock):
+    except BlockingIOError:
+        # the loop has a wakeup pending already
+        pass
+
+def collect_replies():
+    # a batch waits for those offloaded before it
+    while in_flight and in_flight[0][0].done():
+        future, done, count = in_flight.popleft()
 
-    while True:
         try:
-            sock.bind(sock_addr)
+            replies = check_replies(future.result(), count)
 
-        except OSError:
-            print("Socket busy, retrying in 60s...")
-            time.sleep(60)
+        except Exception as err:
+            log.info("Handler failed: %s", err)
+            replies = [error_frame(err)] * count
+
+        done(replies)
+
+def deliver(entries, replies):
+    replies = iter(replies)
+    previous = None
 
+    for key, data, reply in entries:
+        conn = key.data
+
+        # the entries of one read are next to each other
+        if key is not previous:
+            flush_replies(previous)
+            previous = key
+
+        if reply is None and is_plain(data):
+            payload = next(replies)
+
+            if conn.codec is not None:
+                reply = conn.codec.frame(payload)
+            elif payload == b"OK":
+                reply = OK_FRAME
+            else:
+                reply = encode_frame(payload)
+
+        # closed while the handler was busy
+        if conn.sock.fileno() == -1:
             continue
 
+        if reply is not None:
+            conn.queue(reply)
+        elif data == STATS_COMMAND:
+            conn.queue(reply_frame(conn.codec, stats.encode()))
         else:
-            print("Socket bound to %s:%d." % sock_addr)
+            queue_file(conn, data)
+
+        stats.messages_out += 1
+
+    flush_replies(previous)
+
+def flush_replies(key):
+    # nothing queued, or closed while the handler was busy
+    if key is None or not key.data.outq:
+        return
+
+    if server_args.batch_replies:
+        # flushed at the end of the loop iteration
+        pending_flush[key.fd] = key
+    else:
+        # try to reply right away, EVENT_WRITE
+        # is armed only if the socket is full
+        flush_data(key, sel)
+
+def queue_file(conn, request):
+    try:
+        file, offset, count = open_request(request, files_root)
+
+    except FileRequestError as err:
+        conn.queue(reply_frame(conn.codec, error_frame(err)))
+
+        return
+
+    conn.queue(reply_frame(conn.codec, status_frame(count)))
+    conn.queue_file(FileSender(file, offset, count, use_sendfile))
+
+def process_data(key, mask, sel):
+
+    if mask & selectors.EVENT_READ:
+        try:
+            received = key.data.recv()
+
+        except ConnectionError:
+            received = 0
+
+        if not received:
+            close_conn(key, sel)
+
+            return
+
+        key.data.last_active = time.monotonic()
+        stats.bytes_in += received
+
+        conn = key.data
+        frames = 0
 
+        try:
+            for data in conn.inb.frames():
+                frames += 1
+
+                if conn.codec is not None:
+                    data = conn.codec.decode(data)
+
+                message_log(conn.addr, data)
+                stats.messages_in += 1
+
+                if data.startswith(HELLO_COMMAND) and conn.codec is None:
+                    # right away, the next frames may be compressed
+                    reply, conn.codec = accept(
+                            data, server_args.compress,
+                            server_args.compress_level,
+                            server_args.compress_threshold
+                            )
+                    batch.append((key, data, encode_frame(reply)))
+                else:
+                    batch.append((key, data, None))
+
+        except FrameError as err:
+            log.info("Dropping %s: %s", key.data.addr, err)
+            close_conn(key, sel)
+
+            return
+
+        if read_timeout:
+            watch_read(key, completed=frames > 0)
+
+    elif mask & selectors.EVENT_WRITE:
+        flush_data(key, sel)
+
+def process_datagrams(sock, buffer):
+    view = memoryview(buffer)
+    messages = []
+
+    # drain up to a batch of datagrams per wakeup,
+    # replies that do not fit the socket are dropped
+    for _ in range(DATAGRAM_BATCH):
+        try:
+            received, addr = sock.recvfrom_into(buffer)
+
+        except BlockingIOError:
             break
 
-    sock.listen() # number of clients
-    print("Waiting for connections...")
+        except OSError:
+            # e.g. ECONNREFUSED from an earlier reply
+            continue
+
+        # a copy, the buffer is reused for the next one
+        data = bytes(view[:received])
+
+        message_log(addr, data)
+        stats.messages_in += 1
+        stats.bytes_in += received
+
+        if data == STATS_COMMAND:
+            send_datagram(sock, addr, stats.encode())
+        else:
+            messages.append((addr, data))
+
+    if messages:
+        submit(messages, lambda replies: send_datagrams(sock, messages, replies))
+
+def send_datagrams(sock, messages, replies):
+    for (addr, _), reply in zip(messages, replies):
+        send_datagram(sock, addr, reply)
+
+def send_datagram(sock, addr, reply):
+    try:
+        sock.sendto(reply, addr)
+
+    except OSError:
+        return
+
+    stats.messages_out += 1
+    stats.bytes_out += len(reply)
+
+def start_server(sock):
+
+    if is_datagram(sock):
+        log.info("Waiting for datagrams...")
+    else:
+        log.info("Waiting for connections...")
 
     sock.setblocking(False)
     sel.register(sock, selectors.EVENT_READ, data=None)
+    sel.register(wake_r, selectors.EVENT_READ, data=WAKE)
+
+    datagrams = is_datagram(sock)
+    buffer = bytearray(MAX_DATAGRAM)
 
-    while True:
-        events = sel.select(timeout=None)
+    loop_us = stats.loop_us
+
+    while not stopping:
+        events = sel.select(timeout=timers.timeout())
+        started = time.perf_counter()
 
         for key, mask in events:
 
             if key.data is None:
-                addr = accept_conn(sock)
+                if datagrams:
+                    process_datagrams(sock, buffer)
+                else:
+                    accept_conn(sock)
+            elif key.data is WAKE:
+                wake_r.recv(4096)
             else:
-                process_data(key, mask, addr, sel)
+                process_data(key, mask, sel)
+
+        if batch:
+            dispatch_batch()
+
+        if in_flight:
+            collect_replies()
+
+        if pending_flush:
+            for key in list(pending_flush.values()):
+                flush_data(key, sel)
+
+            pending_flush.clear()
+
+        timers.advance()
 
-sel = selectors.DefaultSelector()
+        # time spent on one loop iteration, without select()
+        loop_us.record((time.perf_counter() - started) * 1000000)
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-    sock_addr=('127.0.0.1', 12000)
+def stop_server(signum, frame):
+    global stopping
+
+    stopping = True
+
+def run_server(args, reuse_port=False, sock=None):
+    global sel, timers, stats, server_args, dispatcher, wake_r, wake_w
+
+    sel = selectors.DefaultSelector()
+    timers = TimerWheel()
+    stats = ServerStats()
+    server_args = args
+
+    # pool threads wake up select() through this pair
+    wake_r, wake_w = socket.socketpair()
+    wake_r.setblocking(False)
+    wake_w.setblocking(False)
+
+    signal.signal(signal.SIGTERM, stop_server)
+    signal.set_wakeup_fd(wake_w.fileno(), warn_on_full_buffer=False)
+
+    dispatcher = Dispatcher(args.handler, args.offload, args.offload_workers)
+
+    if sock is None:
+        sock = bind_socket(args, log, reuse_port=reuse_port)
 
     try:
         start_server(sock)
 
     except KeyboardInterrupt:
-        sock.close()
+        pass
+
+    finally:
+        close_socket(sock, args)
+        dispatcher.close()
+
+def configure(args):
+    """Sets the module settings that come from args."""
+    global files_root, use_sendfile, message_log, idle_timeout, read_timeout
+
+    files_root = args.files_root
+    use_sendfile = not args.no_sendfile
+    message_log = message_log_from_args(args)
+
+    idle_timeout = args.idle_timeout
+    read_timeout = args.read_timeout
+
+def run_worker(index, args, shared_counters, sock):
+    global counters, worker_index, log
+
+    # a forked worker needs its own log writer thread
+    log = setup_logging()
+
+    # not inherited unless the worker was forked
+    configure(args)
+
+    counters = shared_counters
+    worker_index = index
+
+    # with an inherited socket all workers accept
+    # on it, otherwise each binds its own
+    try:
+        run_server(args, reuse_port=True, sock=sock)
+
+    finally:
+        # worker processes skip atexit, write out the log here
+        stop_logging()
+
+class Supervisor():
+    """Keeps N worker processes running and sums their counters."""
+
+    def __init__(self, workers, args, sock=None):
+        self.args = args
+        self.sock = sock
+        self.counters = multiprocessing.Array("q", 2 * workers, lock=False)
+        self.processes = [None] * workers
+        self.started = [0.0] * workers
+
+    def start_worker(self, index):
+        process = multiprocessing.Process(
+                target=run_worker,
+                args=(index, self.args, self.counters, self.sock),
+                daemon=True
+                )
+        process.start()
+
+        self.processes[index] = process
+        self.started[index] = time.monotonic()
+
+    def restart_worker(self, index):
+        process = self.processes[index]
+        process.join()
+
+        log.info(
+                "Worker %d (pid %d) exited with code %s, restarting...",
+                index, process.pid, process.exitcode
+                )
+
+        # its connections died with it
+        self.counters[2 * index] = 0
+
+        # do not spin if the worker keeps crashing on start
+        if time.monotonic() - self.started[index] < 1:
+            time.sleep(1)
+
+        self.start_worker(index)
+
+    def run(self):
+        for index in range(len(self.processes)):
+            self.start_worker(index)
+
+        last_report = None
+
+        while True:
+            sentinels = [process.sentinel for process in self.processes]
+            ready = multiprocessing.connection.wait(sentinels, REPORT_INTERVAL)
+
+            for index, process in enumerate(self.processes):
+                if process.sentinel in ready:
+                    self.restart_worker(index)
+
+            report = (
+                    len(self.processes),
+                    sum(self.counters[0::2]),
+                    sum(self.counters[1::2])
+                    )
+
+            if report != last_report:
+                log.info(
+                        "%d workers: %d open connections, %d accepted in total.",
+                        *report
+                        )
+                last_report = report
+
+    def stop(self):
+        processes = [process for process in self.processes if process]
+
+        for process in processes:
+            process.terminate()
+
+        # wait for the workers to write out their logs, so
+        # multiprocessing does not terminate them again
+        for process in processes:
+            process.join(STOP_TIMEOUT)
+
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Selector server example")
+    add_transport_arguments(parser)
+    parser.add_argument(
+            "--workers", type=int, default=1,
+            help="number of SO_REUSEPORT worker processes (default: 1)"
+            )
+    parser.add_argument(
+            "--idle-timeout", type=float, default=idle_timeout,
+            help="disconnect clients silent for this many seconds "
+                "(default: %(default)s, 0 to disable)"
+            )
+    parser.add_argument(
+            "--read-timeout", type=float, default=read_timeout,
+            help="disconnect clients that take longer to send a whole "
+                "message (default: %(default)s, 0 to disable)"
+            )
+    add_arguments(parser)
+    add_file_arguments(parser)
+    add_compression_arguments(
+            parser, help="compress messages for clients that ask for it"
+            )
+    add_handler_arguments(parser)
+    args = parser.parse_args()
+
+    log = setup_logging()
+    configure(args)
+
+    # turn SIGTERM into a normal exit so that the
+    # workers and handler pools are stopped with us
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if args.workers > 1:
+
+        if not hasattr(socket, "SO_REUSEPORT"):
+            parser.error("--workers needs SO_REUSEPORT support")
+
+        # the workers are daemon processes, which
+        # cannot start processes of their own
+        if args.offload == "process":
+            parser.error("--workers needs --offload none or thread")
+
+        sock = inherited_socket(log)
+
+        if sock is None and args.transport == "unix":
+            parser.error("--workers needs --transport tcp or udp")
+
+        supervisor = Supervisor(args.workers, args, sock)
+
+        try:
+            supervisor.run()
+
+        except KeyboardInterrupt:
+            log.info("Received keyboard interrupt.")
+
+        finally:
+            # a second SIGTERM must not cut the shutdown short
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            supervisor.stop()
+
+    else:
+        run_server(args)
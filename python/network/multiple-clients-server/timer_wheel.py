@@ -0,0 +1,89 @@
+# Python3 Timer Wheel Module
+#
+# A hashed timer wheel keeps timers in a ring of slots,
+# one slot per tick. A timer due in n ticks goes into
+# slot (current + n) % len(slots), so scheduling and
+# cancelling are O(1) and every tick only looks at the
+# timers of one slot instead of all of them.
+
+import time
+
+class Timer():
+    __slots__ = ("deadline", "tick", "callback", "slot")
+
+    def __init__(self, deadline, tick, callback):
+        self.deadline = deadline
+        self.tick = tick
+        self.callback = callback
+        self.slot = None
+
+class TimerWheel():
+    """Schedules callbacks with a resolution of one tick."""
+
+    def __init__(self, tick=0.5, slots=512):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.current = int(time.monotonic() / tick)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, delay, callback):
+        """Calls callback() once delay seconds have passed."""
+        deadline = time.monotonic() + delay
+        # never schedule into the tick being processed
+        tick = max(int(deadline / self.tick) + 1, self.current + 1)
+
+        timer = Timer(deadline, tick, callback)
+        timer.slot = self.slots[tick % len(self.slots)]
+        timer.slot.add(timer)
+        self.count += 1
+
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None and timer.slot is not None:
+            timer.slot.discard(timer)
+            timer.slot = None
+            self.count -= 1
+
+    def timeout(self):
+        """Seconds until the next tick, None if nothing is scheduled."""
+        if not self.count:
+            return None
+
+        return max(0.0, (self.current + 1) * self.tick - time.monotonic())
+
+    def advance(self):
+        """Fires every timer that is due, returns how many fired."""
+        now_tick = int(time.monotonic() / self.tick)
+        fired = 0
+
+        # one round over the wheel visits every slot
+        ticks = min(now_tick - self.current, len(self.slots))
+
+        for tick in range(now_tick - ticks + 1, now_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+
+            # timers further than one round away stay
+            due = [timer for timer in slot if timer.tick <= now_tick]
+
+            for timer in due:
+                # cancelled by a callback fired before it
+                if timer.slot is None:
+                    continue
+
+                slot.discard(timer)
+                timer.slot = None
+                self.count -= 1
+
+                timer.callback()
+                fired += 1
+
+        self.current = max(self.current, now_tick)
+
+        return fired
+
+# Note: A timer fires up to one tick late, which is
+# fine for idle timeouts measured in seconds
@@ -0,0 +1,472 @@
+# Python3 Client Library
+#
+# Sends framed requests to the servers in python/network
+# over pooled connections, so a program making many
+# requests does not connect and disconnect for each one.
+#
+#   with Client(("127.0.0.1", 12000)) as client:
+#       client.request(b"hello")             # b"OK"
+#       future = client.submit(b"hello")     # concurrent.futures.Future
+#
+#   async with AsyncClient(("127.0.0.1", 12000)) as client:
+#       await client.request(b"hello")       # b"OK"
+#
+# An address is a (host, port) tuple for TCP or a path for
+# a unix socket. GET (file) requests are not supported,
+# use client-ex.py --get for those.
+
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import json
+import socket
+import threading
+import time
+
+from compression import DEFAULT_THRESHOLD, HELLO_COMMAND, ZLIB, Codec, negotiate
+from framing import HEADER, MAX_FRAME_SIZE, FrameError, FrameReader, encode_frame
+from stats import STATS_COMMAND
+
+# Note: The servers drop clients that stay silent for 300s
+# by default, pooled connections are retired before that
+
+IDLE_TIMEOUT = 240
+CONNECT_TIMEOUT = 10
+
+def open_socket(address, timeout=CONNECT_TIMEOUT):
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+
+        try:
+            sock.connect(address)
+
+        except OSError:
+            sock.close()
+            raise
+
+        return sock
+
+    return socket.create_connection(address, timeout)
+
+class PooledConnection():
+    """A blocking connection, used by one thread at a time."""
+
+    __slots__ = ("address", "sock", "reader", "codec", "last_used")
+
+    def __init__(self, address, timeout=CONNECT_TIMEOUT, compress_level=None,
+            compress_threshold=DEFAULT_THRESHOLD):
+        self.address = address
+        self.sock = open_socket(address, timeout)
+        self.reader = FrameReader()
+        self.codec = None
+        self.last_used = time.monotonic()
+
+        if compress_level is not None:
+            try:
+                self.codec = negotiate(
+                        self.sock, self.reader,
+                        compress_level, compress_threshold
+                        )
+
+            except OSError:
+                self.sock.close()
+                raise
+
+    def request(self, payload):
+        if self.codec is not None:
+            payload = self.codec.encode(payload)
+
+        self.sock.sendall(encode_frame(payload))
+        reply = self.reader.read_frame(self.sock)
+
+        if reply is None:
+            raise ConnectionError("Server closed the connection")
+
+        self.last_used = time.monotonic()
+
+        if self.codec is not None:
+            return self.codec.decode(reply)
+
+        return reply
+
+    def alive(self):
+        """Checks for a close by the server without a round trip."""
+        timeout = self.sock.gettimeout()
+
+        # with a timeout set, recv() would wait for data
+        self.sock.setblocking(False)
+
+        try:
+            # an idle connection has nothing to read
+            self.sock.recv(1, socket.MSG_PEEK)
+
+        except BlockingIOError:
+            return True
+
+        except OSError:
+            return False
+
+        finally:
+            self.sock.settimeout(timeout)
+
+        # EOF, or bytes nobody asked for
+        return False
+
+    def close(self):
+        self.sock.close()
+
+class ConnectionPool():
+    """Idle connections per server address, shared by threads."""
+
+    def __init__(self, max_idle=8, idle_timeout=IDLE_TIMEOUT,
+            timeout=CONNECT_TIMEOUT, compress_level=None,
+            compress_threshold=DEFAULT_THRESHOLD):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        self.idle = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def acquire(self, address):
+        now = time.monotonic()
+
+        while True:
+            with self.lock:
+                idle = self.idle.get(address)
+
+                # the most recently used one is the least
+                # likely to have been closed by the server
+                conn = idle.pop() if idle else None
+
+            if conn is None:
+                break
+
+            if now - conn.last_used < self.idle_timeout and conn.alive():
+                return conn
+
+            conn.close()
+
+        conn = PooledConnection(
+                address, self.timeout,
+                self.compress_level, self.compress_threshold
+                )
+        self.opened += 1
+
+        return conn
+
+    def release(self, conn, reuse=True):
+        if reuse:
+            with self.lock:
+                idle = self.idle[conn.address]
+
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+
+                    return
+
+        conn.close()
+
+    @contextlib.contextmanager
+    def connection(self, address):
+        conn = self.acquire(address)
+
+        try:
+            yield conn
+
+        except BaseException:
+            # a request may be half sent or half answered
+            self.release(conn, reuse=False)
+            raise
+
+        self.release(conn)
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+
+            self.idle.clear()
+
+class Client():
+    """Sends requests to one server, from any number of threads.
+
+    At most max_in_flight requests are sent at once, each
+    on its own pooled connection; request() waits for a
+    free slot and submit() queues the rest."""
+
+    def __init__(self, address, pool=None, max_in_flight=8):
+        self.address = address
+        self.own_pool = pool is None
+        self.pool = pool or ConnectionPool(max_idle=max_in_flight)
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_in_flight,
+                thread_name_prefix="netclient"
+                )
+
+    def request(self, payload):
+        """Sends payload and returns the reply."""
+        with self.slots, self.pool.connection(self.address) as conn:
+            return conn.request(payload)
+
+    def submit(self, payload):
+        """Sends payload in the background, returns a Future of the reply."""
+        return self.executor.submit(self.request, payload)
+
+    def stats(self):
+        return json.loads(self.request(STATS_COMMAND))
+
+    def close(self):
+        self.executor.shutdown()
+
+        if self.own_pool:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class AsyncConnection():
+    """A pipelined asyncio connection.
+
+    Requests are written as soon as they are made and the
+    futures of the replies are resolved in order by a reader
+    task, since the servers answer in order."""
+
+    def __init__(self, address, reader, writer):
+        self.address = address
+        self.reader = reader
+        self.writer = writer
+        self.codec = None
+        self.pending = collections.deque()
+        self.last_used = time.monotonic()
+        self.closed = False
+        self.task = None
+
+    @classmethod
+    async def open(cls, address, timeout=CONNECT_TIMEOUT, compress_level=None,
+            compress_threshold=DEFAULT_THRESHOLD):
+        if isinstance(address, str):
+            connecting = asyncio.open_unix_connection(address)
+        else:
+            connecting = asyncio.open_connection(*address)
+
+        reader, writer = await asyncio.wait_for(connecting, timeout)
+        conn = cls(address, reader, writer)
+
+        try:
+            if compress_level is not None:
+                writer.write(encode_frame(HELLO_COMMAND + ZLIB))
+                reply = await conn.read_frame()
+
+                if reply == HELLO_COMMAND + ZLIB:
+                    conn.codec = Codec(compress_level, compress_threshold)
+
+        except BaseException:
+            writer.close()
+            raise
+
+        conn.task = asyncio.create_task(conn.read_replies())
+
+        return conn
+
+    async def read_frame(self):
+        length, = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+
+        if length > MAX_FRAME_SIZE:
+            raise FrameError(
+                    "Frame of %d bytes exceeds limit of %d bytes" %
+                    (length, MAX_FRAME_SIZE)
+                    )
+
+        return await self.reader.readexactly(length)
+
+    async def read_replies(self):
+        error = ConnectionError("Server closed the connection")
+
+        try:
+            while True:
+                reply = await self.read_frame()
+
+                if not self.pending:
+                    raise FrameError("Reply without a request")
+
+                if self.codec is not None:
+                    reply = self.codec.decode(reply)
+
+                future = self.pending.popleft()
+
+                if not future.done():
+                    future.set_result(reply)
+
+        except asyncio.IncompleteReadError:
+            pass
+
+        except (FrameError, OSError) as err:
+            error = err
+
+        finally:
+            self.close()
+
+            while self.pending:
+                future = self.pending.popleft()
+
+                if not future.done():
+                    future.set_exception(error)
+
+    def send(self, payload):
+        """Writes a request, returns a Future of its reply."""
+        if self.closed:
+            raise ConnectionError("Connection is closed")
+
+        if self.codec is not None:
+            payload = self.codec.encode(payload)
+
+        future = asyncio.get_running_loop().create_future()
+
+        self.writer.write(encode_frame(payload))
+        self.pending.append(future)
+        self.last_used = time.monotonic()
+
+        return future
+
+    async def request(self, payload):
+        future = self.send(payload)
+
+        # wait here while the server is not reading
+        await self.writer.drain()
+
+        return await future
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+class AsyncConnectionPool():
+    """Pipelined connections per server address.
+
+    A request goes to the connection with the fewest replies
+    outstanding; a new connection is opened only when all of
+    them have pipeline requests in flight."""
+
+    def __init__(self, max_connections=4, pipeline=16,
+            idle_timeout=IDLE_TIMEOUT, timeout=CONNECT_TIMEOUT,
+            compress_level=None, compress_threshold=DEFAULT_THRESHOLD):
+        self.max_connections = max_connections
+        self.pipeline = pipeline
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        self.conns = collections.defaultdict(list)
+        self.opening = {}
+        self.opened = 0
+
+    def healthy(self, conn, now):
+        if conn.closed or conn.writer.is_closing():
+            return False
+
+        if not conn.pending and now - conn.last_used > self.idle_timeout:
+            conn.close()
+
+            return False
+
+        return True
+
+    async def acquire(self, address):
+        now = time.monotonic()
+        conns = self.conns[address]
+        conns[:] = [conn for conn in conns if self.healthy(conn, now)]
+
+        best = min(conns, key=lambda conn: len(conn.pending), default=None)
+
+        if best is not None and (
+                len(best.pending) < self.pipeline or
+                len(conns) >= self.max_connections
+                ):
+            return best
+
+        # one connect at a time per address, the
+        # others wait for it instead of piling on
+        opening = self.opening.get(address)
+
+        if opening is None:
+            opening = asyncio.ensure_future(AsyncConnection.open(
+                    address, self.timeout,
+                    self.compress_level, self.compress_threshold
+                    ))
+            self.opening[address] = opening
+
+            try:
+                conn = await opening
+
+            finally:
+                del self.opening[address]
+
+            conns.append(conn)
+            self.opened += 1
+
+            return conn
+
+        return await asyncio.shield(opening)
+
+    async def request(self, address, payload):
+        conn = await self.acquire(address)
+
+        return await conn.request(payload)
+
+    def close(self):
+        for conns in self.conns.values():
+            for conn in conns:
+                conn.close()
+
+        self.conns.clear()
+
+class AsyncClient():
+    """Sends requests to one server from asyncio code.
+
+    At most max_in_flight requests wait for replies at
+    once, the others wait for a free slot first."""
+
+    def __init__(self, address, pool=None, max_in_flight=64):
+        self.address = address
+        self.own_pool = pool is None
+        self.pool = pool or AsyncConnectionPool()
+        self.slots = asyncio.Semaphore(max_in_flight)
+
+    async def request(self, payload):
+        """Sends payload and returns the reply."""
+        async with self.slots:
+            return await self.pool.request(self.address, payload)
+
+    def submit(self, payload):
+        """Starts a request, returns a Future of the reply."""
+        return asyncio.ensure_future(self.request(payload))
+
+    async def stats(self):
+        return json.loads(await self.request(STATS_COMMAND))
+
+    def close(self):
+        if self.own_pool:
+            self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+# Note: A request that fails is not retried, because the
+# server may have handled it before the connection broke
@@ -0,0 +1,230 @@
+# Python3 Server Logging Module
+#
+# Log records are put on a queue by the server and written
+# to stdout in batches by a background thread, so a slow
+# terminal does not stall the event loop. Per-message logs
+# are queued as plain (addr, preview, size) tuples, only
+# the start of the payload is kept, formatted on the
+# writer thread, and can be sampled, rate limited or
+# turned off before anything is queued at all.
+#
+# At most MAX_QUEUED records wait for the writer; while it
+# is behind that far, new records are dropped and counted.
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOGGER_NAME = "network"
+PAYLOAD_PREVIEW = 64
+BATCH_SIZE = 1024
+MAX_QUEUED = 16 * BATCH_SIZE
+
+records = None
+writer = None
+writer_pid = None
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Leaves formatting to the writer thread."""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the arguments we log (addresses, payloads) are
+        # immutable, so the record can be queued as it is
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= MAX_QUEUED:
+            self.dropped += 1
+        else:
+            self.queue.put(record)
+
+class Payload():
+    """Decodes a message payload only when it is written out."""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+
+    def __str__(self):
+        text = self.data.decode("utf-8", "replace")
+
+        if self.size > PAYLOAD_PREVIEW:
+            text += "... (%d bytes)" % self.size
+
+        return text
+
+class TokenBucket():
+    """Allows rate events per second with bursts of up to burst."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+
+            return True
+
+        return False
+
+class LogWriter(threading.Thread):
+    """Writes queued log records and messages in batches."""
+
+    def __init__(self, records, stream):
+        super().__init__(name="log-writer", daemon=True)
+        self.records = records
+        self.stream = stream
+        self.formatter = logging.Formatter("%(message)s")
+
+    def format(self, record):
+        if isinstance(record, logging.LogRecord):
+            return self.formatter.format(record)
+
+        addr, data, size = record
+
+        return "Got message from %s: %s" % (addr, Payload(data, size))
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.records.get_nowait())
+
+            except queue.Empty:
+                pass
+
+            stop = batch[-1] is None
+
+            if stop:
+                batch.pop()
+
+            if batch:
+                # one write for the whole batch
+                self.stream.write(
+                        "\n".join(self.format(record) for record in batch) + "\n"
+                        )
+                self.stream.flush()
+
+            if stop:
+                break
+
+    def stop(self):
+        self.records.put(None)
+        self.join()
+
+class MessageLog():
+    """Logs received messages, call it as message_log(addr, data)."""
+
+    def __init__(self, enabled=True, sample=1, rate=0):
+        self.enabled = enabled
+        self.sample = max(sample, 1)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.seen = 0
+        self.dropped = 0
+
+    def __call__(self, addr, data):
+        if not self.enabled:
+            return
+
+        self.seen += 1
+
+        if self.sample > 1 and self.seen % self.sample:
+            return
+
+        if self.bucket is not None and not self.bucket.take():
+            self.dropped += 1
+
+            return
+
+        # the writer is far behind, do not pile up more
+        if records.qsize() >= MAX_QUEUED:
+            self.dropped += 1
+
+            return
+
+        # the queue of the current writer, see setup_logging();
+        # a copy of the preview only, not the whole payload
+        records.put((addr, bytes(data[:PAYLOAD_PREVIEW]), len(data)))
+
+def stop_logging():
+    global writer
+
+    # a writer inherited through fork() has no thread
+    if writer is not None and writer_pid == os.getpid():
+        writer.stop()
+
+    writer = None
+
+def setup_logging(stream=None):
+    """(Re)starts the writer thread, returns the server logger.
+
+    Call it again in a forked child: threads do not survive
+    fork(), so the child needs a writer thread of its own."""
+    global records, writer, writer_pid
+
+    stop_logging()
+
+    logger = logging.getLogger(LOGGER_NAME)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    # a SimpleQueue and a qsize() check instead of
+    # queue.Queue(maxsize), whose put() costs ten times more
+    records = queue.SimpleQueue()
+
+    logger.addHandler(DeferredQueueHandler(records))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    writer = LogWriter(records, stream or sys.stdout)
+    writer.start()
+    writer_pid = os.getpid()
+
+    return logger
+
+def add_arguments(parser):
+    parser.add_argument(
+            "--message-log", choices=("all", "off"), default="all",
+            help="log every received message or none (default: all)"
+            )
+    parser.add_argument(
+            "--log-sample", type=int, default=1, metavar="N",
+            help="log only every Nth received message"
+            )
+    parser.add_argument(
+            "--log-rate", type=float, default=0, metavar="N",
+            help="log at most N received messages per second"
+            )
+
+def message_log_from_args(args):
+    return MessageLog(
+            enabled=args.message_log != "off",
+            sample=args.log_sample,
+            rate=args.log_rate
+            )
+
+atexit.register(stop_logging)
+
+# Note: stop_logging() writes out every record still
+# in the queue before the writer thread exits
@@ -1,54 +1,282 @@
 # Python3 server example
 
+import argparse
+import concurrent.futures
+import os
 import socket
-import time
+import sys
+import threading
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    sock_addr=('127.0.0.1', 12000)
+from compression import HELLO_COMMAND, accept, reply_frame
+from compression import add_arguments as add_compression_arguments
+from fileserve import (
+        GET_COMMAND, FileRequestError, error_frame, open_request,
+        send_file, status_frame
+        )
+from fileserve import add_arguments as add_file_arguments
+from framing import HEADER, FrameError, FrameReader, encode_frame
+from netlog import add_arguments, message_log_from_args, setup_logging
+from stats import STATS_COMMAND, ServerStats
+from transport import (
+        MAX_DATAGRAM, bind_socket, close_socket, corked, is_datagram,
+        tune_socket, uncork
+        )
+from transport import add_arguments as add_transport_arguments
 
+OK_FRAME = encode_frame(b"OK")
+OK_DATAGRAM = b"OK"
+BUSY_FRAME = encode_frame(b"BUSY")
+
+stats = ServerStats()
+
+open_conns = set()
+open_conns_lock = threading.Lock()
+
+def serve_conn(conn, addr):
+
+    with open_conns_lock:
+        open_conns.add(conn)
+
+    try:
+        reader = FrameReader()
+        replies = []
+        cork = corked(conn, args)
+        codec = None
+
+        while True:
+            data = reader.read_frame(conn)
+
+            if data is None:
+                break
+
+            while data is not None:
+                stats.messages_in += 1
+                stats.bytes_in += len(data) + HEADER.size
+
+                if codec is not None:
+                    data = codec.decode(data)
+
+                message_log(addr, data)
+
+                if data == STATS_COMMAND:
+                    replies.append(reply_frame(codec, stats.encode()))
+                elif data.startswith(GET_COMMAND):
+                    # earlier replies go first
+                    send_replies(conn, replies)
+                    stats.bytes_out += serve_file(conn, codec, data)
+                elif data.startswith(HELLO_COMMAND) and codec is None:
+                    reply, codec = accept(
+                            data, args.compress,
+                            args.compress_level, args.compress_threshold
+                            )
+                    replies.append(encode_frame(reply))
+                elif codec is None:
+                    replies.append(OK_FRAME)
+                else:
+                    replies.append(codec.frame(b"OK"))
+
+                stats.messages_out += 1
+
+                # with --batch-replies, answer every message
+                # received so far before blocking again
+                data = reader.next_frame() if args.batch_replies else None
+
+            send_replies(conn, replies)
+
+            if cork:
+                uncork(conn)
+
+    except (FrameError, OSError) as err:
+        log.info("Dropping %s: %s", addr, err)
+
+    finally:
+        log.info("Closing connection.")
+
+        with open_conns_lock:
+            open_conns.discard(conn)
+
+        conn.close()
+        stats.closed += 1
+
+def send_replies(conn, replies):
+    if not replies:
+        return
+
+    if len(replies) == 1:
+        reply = replies[0]
+    else:
+        reply = b"".join(replies)
+
+    conn.sendall(reply)
+    stats.bytes_out += len(reply)
+    replies.clear()
+
+def serve_file(conn, codec, request):
+    """Answers a GET request, returns the number of bytes sent."""
+    try:
+        file, offset, count = open_request(request, args.files_root)
+
+    except FileRequestError as err:
+        reply = reply_frame(codec, error_frame(err))
+        conn.sendall(reply)
+
+        return len(reply)
+
+    with file:
+        reply = reply_frame(codec, status_frame(count))
+        conn.sendall(reply)
+        send_file(conn, file, offset, count, not args.no_sendfile)
+
+    return len(reply) + HEADER.size + count
+
+def reject_conn(conn, addr):
+    log.info("Too many clients, rejecting %s.", addr)
+
+    # tell the client right away instead of letting it hang
+    try:
+        conn.setblocking(False)
+        conn.send(BUSY_FRAME)
+
+    except OSError:
+        pass
+
+    conn.close()
+    stats.closed += 1
+
+def serve_datagrams(sock):
+    buffer = bytearray(MAX_DATAGRAM)
+    view = memoryview(buffer)
+
+    # no connections, every datagram is a message
     while True:
+        received, addr = sock.recvfrom_into(buffer)
+
+        # a copy, the log writer thread formats it later and
+        # the buffer is reused for the next datagram
+        data = bytes(view[:received])
+
+        message_log(addr, data)
+        stats.messages_in += 1
+        stats.bytes_in += received
+
+        if data == STATS_COMMAND:
+            reply = stats.encode()
+        else:
+            reply = OK_DATAGRAM
+
         try:
-            sock.bind(sock_addr)
+            sock.sendto(reply, addr)
 
         except OSError:
-            print("Socket busy, retrying in 60s...")
-            time.sleep(60)
-
             continue
 
-        else:
-            print("Socket bound to %s:%d." % sock_addr)
+        stats.messages_out += 1
+        stats.bytes_out += len(reply)
 
-            break
+def close_open_conns():
+    # wakes up pool threads blocked in recv()
+    with open_conns_lock:
+        for conn in open_conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+
+            except OSError:
+                pass
+
+parser = argparse.ArgumentParser(description="Single client server example")
+add_transport_arguments(
+        parser, backlog_help="listen backlog (default: 1, or 128 with --threads)"
+        )
+parser.add_argument(
+        "--threads", type=int, default=0,
+        help="serve up to this many clients at once from a thread pool "
+            "(default: one client at a time)"
+        )
+parser.add_argument(
+        "--max-queue", type=int, default=None,
+        help="clients allowed to wait for a free thread before new ones "
+            "are rejected (default: same as --threads)"
+        )
+add_arguments(parser)
+add_file_arguments(parser)
+add_compression_arguments(
+        parser, help="compress messages for clients that ask for it"
+        )
+args = parser.parse_args()
+
+log = setup_logging()
+message_log = message_log_from_args(args)
+
+if args.backlog is None:
+    args.backlog = 128 if args.threads else 1
 
-    sock.listen(1) # number of clients
-    conn = None
-    print("Waiting for connections...")
+if args.max_queue is None:
+    args.max_queue = args.threads
+
+sock = bind_socket(args, log, backlog=args.backlog)
+
+if is_datagram(sock):
+    log.info("Waiting for datagrams...")
+
+    try:
+        serve_datagrams(sock)
+
+    except KeyboardInterrupt:
+        log.info("Received keyboard interrupt.")
+
+    finally:
+        sock.close()
+
+    sys.exit()
+
+with sock:
+
+    log.info("Waiting for connections...")
+
+    pool = None
+
+    if args.threads:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.threads)
+
+        # clients being served plus clients waiting for a thread
+        slots = threading.BoundedSemaphore(args.threads + args.max_queue)
 
     while True:
 
         try:
             conn, addr = sock.accept()
+            tune_socket(conn, args)
 
-            print("Accepted connection from: %s" % str(addr))
+            if not addr:
+                # unix socket clients have no address
+                addr = "unix client %d" % conn.fileno()
 
-            while True:
-                data = conn.recv(64)
+            log.info("Accepted connection from: %s", addr)
+            stats.accepted += 1
 
-                if not data:
-                    break
-                else:
-                    print("Got message from %s: %s" % (str(addr), data.decode("utf-8")))
-                    conn.sendall(b"OK")
+            if pool is None:
+                serve_conn(conn, addr)
+
+            elif slots.acquire(blocking=False):
+                future = pool.submit(serve_conn, conn, addr)
+                future.add_done_callback(lambda future: slots.release())
+
+            else:
+                reject_conn(conn, addr)
 
         except KeyboardInterrupt:
-            print("Received keyboard interrupt.")
+            log.info("Received keyboard interrupt.")
 
             break
 
-        finally:
-            print("Closing connection.")
+    if pool is not None:
+        close_open_conns()
+        pool.shutdown(cancel_futures=True)
+
+close_socket(sock, args)
 
-            if conn:
-                conn.close()
+# Note: Without --threads the server still handles
+# one client at a time, the next one waits in the
+# listen backlog until the current one disconnects
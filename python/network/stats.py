@@ -0,0 +1,128 @@
+# Python3 Server Statistics Module
+#
+# Plain counters and a log-linear latency histogram, all
+# allocated up front and updated without locks, so they
+# are cheap enough to leave on. A client can fetch them
+# by sending a message containing just b"STATS".
+
+import json
+import time
+
+STATS_COMMAND = b"STATS"
+
+class Histogram():
+    """HDR-style histogram of integer values (e.g. microseconds).
+
+    Values are bucketed by their power of two and then
+    linearly into 2**sub_bits sub-buckets, so every bucket
+    is within about 1 / 2**sub_bits of its values."""
+
+    def __init__(self, sub_bits=4, max_bits=32):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.counts = [0] * ((max_bits - sub_bits + 1) * self.sub_count)
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        # values below 2 * sub_count get a bucket each
+        shift = value.bit_length() - self.sub_bits - 1
+
+        if shift <= 0:
+            return value
+
+        return shift * self.sub_count + (value >> shift)
+
+    def value_at(self, index):
+        """Returns the highest value counted in a bucket."""
+        if index < 2 * self.sub_count:
+            return index
+
+        shift = index // self.sub_count - 1
+        sub = index - shift * self.sub_count
+
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = int(value)
+        index = min(self.index(value), len(self.counts) - 1)
+
+        self.counts[index] += 1
+        self.total += 1
+
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if not self.total:
+            return 0
+
+        wanted = self.total * p / 100
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if count and seen >= wanted:
+                return min(self.value_at(index), self.max)
+
+        return self.max
+
+    def summary(self):
+        return {
+                "count": self.total,
+                "p50": self.percentile(50),
+                "p99": self.percentile(99),
+                "p999": self.percentile(99.9),
+                "max": self.max
+                }
+
+class ServerStats():
+    """Counters of one server process."""
+
+    __slots__ = (
+            "started", "accepted", "closed", "messages_in", "messages_out",
+            "bytes_in", "bytes_out", "loop_us", "last_time", "last_messages"
+            )
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.accepted = 0
+        self.closed = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.loop_us = Histogram()
+        self.last_time = self.started
+        self.last_messages = 0
+
+    def snapshot(self):
+        now = time.monotonic()
+        uptime = now - self.started
+        interval = now - self.last_time
+
+        # messages/sec since the previous snapshot
+        rate = (self.messages_in - self.last_messages) / interval if interval else 0.0
+
+        self.last_time = now
+        self.last_messages = self.messages_in
+
+        return {
+                "uptime": round(uptime, 3),
+                "accepted": self.accepted,
+                "open": self.accepted - self.closed,
+                "messages_in": self.messages_in,
+                "messages_out": self.messages_out,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "messages_per_sec": round(rate, 1),
+                "loop_us": self.loop_us.summary()
+                }
+
+    def encode(self):
+        return json.dumps(self.snapshot()).encode("utf-8")
+
+# Note: Without locks the counters of the thread-pool
+# server may miss an occasional increment; for stats
+# that is a fair price for not slowing every message
@@ -0,0 +1,259 @@
+# Python3 Transport Module
+#
+# The client and servers can talk over
+#
+#   tcp    TCP on --host/--port (the default)
+#   unix   a unix domain stream socket at --path, which
+#          skips the TCP/IP stack for local clients
+#   udp    UDP datagrams on --host/--port, one message
+#          per datagram and no framing
+#
+# All of them are selected with --transport.
+#
+# A server started by systemd socket activation (or any
+# supervisor that sets LISTEN_FDS and LISTEN_PID) serves
+# the socket it inherits instead of binding a new one, so
+# it can be restarted without refusing any connections.
+
+import os
+import socket
+import stat
+import time
+
+TRANSPORTS = ("tcp", "unix", "udp")
+UNIX_PATH = "/tmp/network-ex.sock"
+
+# Note: Python has no recvmmsg(), so datagram servers read
+# up to DATAGRAM_BATCH datagrams per wakeup in a loop
+# until the socket would block
+
+DATAGRAM_BATCH = 64
+MAX_DATAGRAM = 65535
+
+# Note: A busy address is retried after BIND_DELAY
+# seconds, doubling the delay up to BIND_MAX_DELAY
+
+BIND_DELAY = 0.1
+BIND_MAX_DELAY = 10.0
+
+# the first inherited fd, see sd_listen_fds(3)
+LISTEN_FDS_START = 3
+
+bound_paths = set()
+
+def add_arguments(parser,
+        backlog_help="listen backlog (default: %d)" % socket.SOMAXCONN):
+    parser.add_argument(
+            "--transport", choices=TRANSPORTS, default="tcp",
+            help="tcp, unix (domain socket) or udp (default: tcp)"
+            )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12000)
+    parser.add_argument(
+            "--path", default=UNIX_PATH,
+            help="unix socket path (default: %(default)s)"
+            )
+    parser.add_argument(
+            "--backlog", type=int, default=None, help=backlog_help
+            )
+    parser.add_argument(
+            "--bind-timeout", type=float, default=0,
+            help="give up if the address is still busy after this many "
+                "seconds (default: keep trying)"
+            )
+    parser.add_argument(
+            "--nodelay", action="store_true",
+            help="set TCP_NODELAY on connections (turns off Nagle)"
+            )
+    parser.add_argument(
+            "--cork", action="store_true",
+            help="cork connections with TCP_CORK while replies are queued"
+            )
+    parser.add_argument(
+            "--batch-replies", action="store_true",
+            help="write the replies to all messages received in one go "
+                "with a single send"
+            )
+
+def address(args):
+    """Returns (family, type, address) for the chosen transport."""
+    if args.transport == "unix":
+        return socket.AF_UNIX, socket.SOCK_STREAM, args.path
+
+    if args.transport == "udp":
+        return socket.AF_INET, socket.SOCK_DGRAM, (args.host, args.port)
+
+    return socket.AF_INET, socket.SOCK_STREAM, (args.host, args.port)
+
+def tune_socket(sock, args):
+    """Applies --nodelay and --cork to an accepted TCP connection."""
+    if sock.family == socket.AF_UNIX or sock.type != socket.SOCK_STREAM:
+        return
+
+    if args.nodelay:
+        # small replies go out right away instead of
+        # waiting for the previous one to be acked
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    if corked(sock, args):
+        # only full segments go out until uncork()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+
+def uncork(sock):
+    """Pushes out a partial segment held back by TCP_CORK."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 0)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1)
+
+def corked(sock, args):
+    """True if tune_socket() corks this connection."""
+    return (
+            args.cork and hasattr(socket, "TCP_CORK") and
+            sock.family != socket.AF_UNIX and sock.type == socket.SOCK_STREAM
+            )
+
+def describe(addr):
+    if isinstance(addr, tuple):
+        return "%s:%d" % addr[:2]
+
+    return addr
+
+def is_datagram(sock):
+    return sock.type == socket.SOCK_DGRAM
+
+def remove_stale_socket(path, check=False):
+    # a unix socket file is left behind if a server dies
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+
+        if check:
+            # a running server still accepts on it
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(path)
+
+            return
+
+    except FileNotFoundError:
+        return
+
+    except ConnectionRefusedError:
+        pass
+
+    os.unlink(path)
+
+def inherited_socket(log=None):
+    """Returns the socket passed in LISTEN_FDS, or None."""
+    try:
+        pid = int(os.environ.get("LISTEN_PID", ""))
+        fds = int(os.environ.get("LISTEN_FDS", ""))
+
+    except ValueError:
+        return None
+
+    # the variables may have been meant for our parent
+    if pid != os.getpid() or fds < 1:
+        return None
+
+    # our own children must not take the socket again
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+
+    sock = socket.socket(fileno=LISTEN_FDS_START)
+
+    if log is not None:
+        log.info("Inherited socket bound to %s.", describe(sock.getsockname()))
+
+    return sock
+
+def bind_with_backoff(sock, addr, log, timeout=0):
+    delay = BIND_DELAY
+    deadline = time.monotonic() + timeout if timeout else None
+
+    while True:
+        try:
+            sock.bind(addr)
+
+            return
+
+        except OSError as err:
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+
+            log.info("Socket busy (%s), retrying in %.1fs...", err.strerror, delay)
+
+        time.sleep(delay)
+        delay = min(delay * 2, BIND_MAX_DELAY)
+
+def bind_socket(args, log, backlog=None, reuse_port=False):
+    """Creates, binds and (for streams) listens on a server socket."""
+    if backlog is None:
+        backlog = args.backlog
+
+    sock = inherited_socket(log)
+
+    if sock is not None:
+        if backlog is not None and sock.type == socket.SOCK_STREAM:
+            sock.listen(backlog)
+
+        return sock
+
+    family, sock_type, addr = address(args)
+    sock = socket.socket(family, sock_type)
+
+    if family == socket.AF_INET and sock_type == socket.SOCK_STREAM:
+        # connections of the previous server in TIME_WAIT
+        # do not keep us from binding the port again
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    if reuse_port:
+        # every worker binds the same address and
+        # the kernel spreads new connections on them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    if family == socket.AF_UNIX:
+        remove_stale_socket(addr, check=True)
+
+    try:
+        bind_with_backoff(sock, addr, log, args.bind_timeout)
+
+    except OSError as err:
+        sock.close()
+        raise SystemExit("Cannot bind %s: %s" % (describe(addr), err.strerror))
+
+    log.info("Socket bound to %s.", describe(addr))
+
+    if family == socket.AF_UNIX:
+        bound_paths.add(addr)
+
+    if sock_type == socket.SOCK_STREAM:
+        sock.listen(socket.SOMAXCONN if backlog is None else backlog)
+
+    return sock
+
+def close_socket(sock, args):
+    sock.close()
+
+    # an inherited unix socket belongs to whoever made it
+    if args.transport == "unix" and args.path in bound_paths:
+        bound_paths.discard(args.path)
+        remove_stale_socket(args.path)
+
+def connect(args):
+    family, sock_type, addr = address(args)
+    sock = socket.socket(family, sock_type)
+
+    try:
+        # for UDP this only sets the default destination
+        sock.connect(addr)
+
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+# Note: To try socket activation without a unit file run
+# systemd-socket-activate -l 127.0.0.1:12000 \
+#     python3 multiple-clients-server/server-ex.py
+# the socket keeps queueing connections while the server
+# restarts, so clients only see a short delay
@@ -0,0 +1,140 @@
+# Python3 Roster Benchmark Example
+#
+# Generates a large roster, turns it into its alternate
+# universe version with transform_roster() and with
+# transform_roster_parallel() on 1 to N processes, checks
+# that all of them wrote the same file and prints how long
+# each one took. Before that it times writing the roster
+# with RosterWriter against a write() per member.
+
+import argparse
+import filecmp
+import itertools
+import os
+import tempfile
+import time
+
+from roster import (
+        CHUNK_SIZE, RosterWriter, transform_roster, transform_roster_parallel
+        )
+
+CREW = (
+        "Picard", "Riker", "Data", "Geordi",
+        "Worf", "Wesley", "Beverly", "Deanna"
+        )
+
+def int_list(text):
+    return [int(value) for value in text.split(",")]
+
+def default_workers():
+    # 1, 2, 4, ... up to the number of CPUs
+    workers = [1]
+
+    while workers[-1] * 2 <= os.cpu_count():
+        workers.append(workers[-1] * 2)
+
+    if workers[-1] != os.cpu_count():
+        workers.append(os.cpu_count())
+
+    return workers
+
+def generate_roster(path, members):
+    with open(path, "w", buffering=1024 * 1024) as file:
+        for member in crew_names(members):
+            file.write(member + "\n")
+
+def crew_names(members):
+    names = itertools.cycle(CREW)
+
+    return ("%s%d" % (next(names), number) for number in range(members))
+
+def crew_names_cached(members, cached=100000):
+    # the same names over and over, cheap to generate
+    names = list(crew_names(min(members, cached)))
+
+    return itertools.islice(itertools.cycle(names), members)
+
+def write_per_member(path, members):
+    # how files-ex.py used to write werc.txt
+    with open(path, "w") as file:
+        for member in members:
+            file.write(member + "\n")
+
+    with open(path, "a") as file:
+        file.write("Q\n")
+
+def write_roster(path, members, durable):
+    with RosterWriter(path, durable=durable) as writer:
+        writer.write_all(members)
+        writer.write("Q")
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+
+    return time.perf_counter() - start
+
+parser = argparse.ArgumentParser(description="Roster benchmark example")
+parser.add_argument("--members", type=int, default=5000000)
+parser.add_argument(
+        "--workers", type=int_list, default=default_workers(),
+        help="comma separated process counts (default: 1,2,4,... CPUs)"
+        )
+parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE // 1024 // 1024,
+        metavar="MB", help="bytes per task in MB (default: %(default)s)"
+        )
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory() as directory:
+    source = os.path.join(directory, "crew.txt")
+    expected = os.path.join(directory, "werc.txt")
+    target = os.path.join(directory, "werc-parallel.txt")
+
+    for name, function, extra in (
+            ("write()", write_per_member, ()),
+            ("RosterWriter", write_roster, (True,)),
+            ("no fsync", write_roster, (False,)),
+            ):
+        elapsed = timed(
+                function, target, crew_names_cached(args.members), *extra
+                )
+        print("%-12s %6.2fs" % (name, elapsed))
+
+    generate_roster(source, args.members)
+    print("Roster of %d members, %.1f MB" %
+            (args.members, os.path.getsize(source) / 1024 / 1024))
+
+    sequential = timed(transform_roster, source, expected, extra=["Q"])
+    print("%-12s %6.2fs" % ("sequential", sequential))
+
+    for workers in args.workers:
+        elapsed = timed(
+                transform_roster_parallel, source, target, extra=["Q"],
+                workers=workers, chunk_size=args.chunk_size * 1024 * 1024
+                )
+
+        if not filecmp.cmp(expected, target, shallow=False):
+            raise SystemExit("Output of %d workers differs" % workers)
+
+        print("%-12s %6.2fs  %4.2fx" %
+                ("%d workers" % workers, elapsed, sequential / elapsed))
+# write()        0.66s
+# RosterWriter   0.23s
+# no fsync       0.26s
+# Roster of 5000000 members, 63.3 MB
+# sequential     3.76s
+# 1 workers      4.41s  0.85x
+# 2 workers      4.40s  0.85x
+# 4 workers      4.78s  0.79x
+
+# Note: RosterWriter joins and encodes members in batches
+# and hands the buffer to os.writev(), instead of going
+# through a text file write() per member; with fsync it
+# is still faster, the roster is only 63 MB
+
+# Note: The numbers above are from a machine with one CPU,
+# where the workers only add the cost of sending chunks
+# between processes. On N CPUs they transform N chunks at
+# a time, until the parent writing the chunks in order
+# becomes the limit
@@ -1,8 +1,12 @@
 # Python3 File Examples
 
+from roster import (
+        MappedRoster, RosterReader, RosterWriter,
+        transform_roster, werc_name
+        )
+
 try:
-    with open("crew.txt") as crew_file:
-        crew = crew_file.read()
+    crew_file = RosterReader("crew.txt")
 
 except FileNotFoundError:
     print("Oh no! File crew.txt not found!")
@@ -10,8 +14,15 @@ except FileNotFoundError:
 else:
     print("Crew members are:")
 
-    for crew_member in crew.split():
-        print("\t* " + crew_member)
+    with crew_file, RosterWriter("werc.txt") as werc_file:
+        for crew_member in crew_file:
+            print("\t* " + crew_member)
+            werc_file.write(werc_name(crew_member))
+
+        werc_file.write("Q")
+
+finally:
+    print("File either opened or failed.")
 # Crew members are:
 #	* Picard
 #	* Riker
@@ -21,66 +32,29 @@ else:
 #	* Wesley
 #	* Beverly
 #	* Deanna
+# File either opened or failed.
 
 # Note: The 'with' keyword is similar
 # to try/catch; it will also close the
 # file/stream automatically when done
 
-print("We will repeat crew members:")
-
-try:
-    with open("crew.txt") as crew_file:
-        for crew_member in crew_file:
-            # rstrip() to remove \n at line end
-            print("\t* " + crew_member.rstrip())
-
-except FileNotFoundError:
-    print("We could not repeat crew members")
-# Crew members are:
-#	* Picard
-#	* Riker
-#	* Data
-#	* Geordi
-#	* Worf
-#	* Wesley
-#	* Beverly
-#	* Deanna
-
-try:
-    with open("crew.txt") as crew_file:
-        crew = crew_file.readlines()
-
-except FileNotFoundError:
-    print("Oh no, could not find crew.txt!")
-
-else:
-    for crew_number in range(0, len(crew)):
-        crew[crew_number] = crew[crew_number].rstrip()
-
-    print("Once more:")
-    print(crew)
-
-finally:
-    print("File either opened or failed.")
-# Once more:
-# ['Picard', 'Riker', 'Data', 'Geordi', 'Worf', 'Wesley', 'Beverly', 'Deanna']
-# File either opened or failed.
-
 # Note: Block under 'finally' will run after try
 # finishes whether there was an exception or not
 
-with open("werc.txt", "w") as werc_file:
-    for crew_member in crew:
-        werc_file.write("".join(reversed(crew_member)).title() + "\n")
+# Note: crew.txt is read once, line by line, and each
+# member is written to werc.txt as soon as it is read;
+# Q is added by the same writer instead of reopening
+# werc.txt in "a" mode
 
-with open("werc.txt", "a") as werc_file:
-    werc_file.write("Q\n")
+# Note: RosterWriter writes to a temporary file which
+# replaces werc.txt at the end of the with block, a
+# reader never sees half of a new werc.txt
 
 try:
     print("Alternate universe crew:")
-    with open("werc.txt") as werc_file:
-        for werc in werc_file.readlines():
-            print("\t- " + werc.rstrip())
+    with RosterReader("werc.txt") as werc_file:
+        for werc in werc_file:
+            print("\t- " + werc)
 
 except FileNotFoundError:
     pass    # do nothing
@@ -94,3 +68,21 @@ except FileNotFoundError:
 #       - Ylreveb
 #       - Annaed
 #       - Q
+
+print("Lines written: %d" % transform_roster(
+        "crew.txt", "werc.txt", extra=["Q"]
+        ))
+# Lines written: 9
+
+# Note: transform_roster() is the same pipeline without
+# the printing, its memory use does not grow with the
+# size of the roster
+
+with MappedRoster("crew.txt") as crew:
+    print("%d crew members, third is %s, last two are %s" %
+            (len(crew), crew[2], ", ".join(crew[-2:])))
+# 8 crew members, third is Data, last two are Beverly, Deanna
+
+# Note: MappedRoster finds the members through an index
+# of line offsets saved in crew.txt.idx, only the three
+# members asked for are read from crew.txt
@@ -0,0 +1,465 @@
+# Python3 Roster Module
+#
+# A roster file has one crew member per line. The readers
+# and writers here stream it: lines are read and written
+# in buffered chunks and passed along by generators, so a
+# roster of any size is processed in constant memory.
+#
+#   transform_roster("crew.txt", "werc.txt", extra=["Q"])
+#   transform_roster_parallel("crew.txt", "werc.txt", workers=4)
+#
+# MappedRoster gives random access instead: roster[n],
+# roster[a:b] and len(roster) without reading the file.
+
+import array
+import collections
+import concurrent.futures
+import mmap
+import itertools
+import os
+import shutil
+import struct
+
+BUFFER_SIZE = 1024 * 1024
+
+# members RosterWriter.write_all() encodes at once
+WRITE_BATCH = 4096
+
+# most buffers one os.writev() call accepts
+IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 16
+
+# tell apart the temporary files of writers in a process
+temp_numbers = itertools.count()
+
+# bytes of roster per task of transform_roster_parallel()
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# magic, size and mtime of the roster, number of members;
+# the offsets follow as native 8 byte integers
+INDEX_MAGIC = b"ROSTIDX1"
+INDEX_HEADER = struct.Struct("=8sQQQ")
+INDEX_SUFFIX = ".idx"
+
+class RosterReader():
+    """Iterates over the members of a roster file.
+
+    The file is opened right away, so a missing file raises
+    FileNotFoundError here and not on the first next()."""
+
+    def __init__(self, path, buffering=BUFFER_SIZE):
+        self.file = open(path, encoding="utf-8", buffering=buffering)
+
+    def __iter__(self):
+        for line in self.file:
+            member = line.strip()
+
+            # blank lines are not crew members
+            if member:
+                yield member
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class RosterWriter():
+    """Writes members to a roster file, one line each.
+
+    Nothing is written to path itself: the lines go to a
+    temporary file next to it, which replaces path only on
+    commit(), so readers see the old file or the complete
+    new one. With append=True the temporary file starts as
+    a copy of path. Leaving a with block through an
+    exception calls abort() and leaves path as it was."""
+
+    def __init__(self, path, append=False, buffer_size=BUFFER_SIZE,
+            durable=True):
+        self.path = path
+        self.temp_path = "%s.%d-%d.tmp" % (
+                path, os.getpid(), next(temp_numbers)
+                )
+        self.buffer_size = buffer_size
+        self.durable = durable
+        self.count = 0
+
+        # text not encoded yet and bytes not written yet
+        self.text = []
+        self.text_size = 0
+        self.parts = []
+        self.parts_size = 0
+
+        try:
+            mode = os.stat(path).st_mode
+
+        except FileNotFoundError:
+            mode = None
+
+        if append and mode is not None:
+            shutil.copyfile(path, self.temp_path)
+            self.fd = os.open(self.temp_path, os.O_WRONLY | os.O_APPEND)
+        else:
+            self.fd = os.open(
+                    self.temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666
+                    )
+
+        if mode is not None:
+            os.chmod(self.temp_path, mode)
+
+    def write(self, member):
+        self.text.append(member)
+        self.text.append("\n")
+        self.text_size += len(member) + 1
+        self.count += 1
+
+        if self.text_size + self.parts_size >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, members):
+        members = iter(members)
+
+        # joined and encoded in batches, not one by one
+        while True:
+            batch = list(itertools.islice(members, WRITE_BATCH))
+
+            if not batch:
+                break
+
+            # with a newline after the last one too
+            batch.append("")
+            data = "\n".join(batch).encode("utf-8")
+            self.write_encoded(data, len(batch) - 1)
+
+    def write_encoded(self, data, count):
+        """Adds count lines that are already encoded."""
+        self.count += count
+
+        # e.g. a chunk of blank lines, writev() would return 0
+        if not data:
+            return
+
+        self.encode_text()
+        self.parts.append(data)
+        self.parts_size += len(data)
+
+        if self.parts_size >= self.buffer_size:
+            self.flush()
+
+    def encode_text(self):
+        if self.text:
+            data = "".join(self.text).encode("utf-8")
+            self.text.clear()
+            self.text_size = 0
+            self.parts.append(data)
+            self.parts_size += len(data)
+
+    def flush(self):
+        """Writes the buffer to the temporary file."""
+        self.encode_text()
+
+        # an empty part would never be popped below
+        parts = self.parts = [part for part in self.parts if part]
+
+        while parts:
+            # writev() takes at most IOV_MAX buffers
+            written = os.writev(self.fd, parts[:IOV_MAX])
+
+            # a short write leaves part of a buffer behind
+            while written:
+                if written >= len(parts[0]):
+                    written -= len(parts.pop(0))
+                else:
+                    parts[0] = parts[0][written:]
+                    written = 0
+
+        self.parts_size = 0
+
+    def commit(self):
+        """Replaces path with everything written so far."""
+        if self.fd is None:
+            return
+
+        try:
+            self.flush()
+
+            if self.durable:
+                os.fsync(self.fd)
+
+        except BaseException:
+            self.abort()
+            raise
+
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.temp_path, self.path)
+
+        if self.durable:
+            # the rename is only durable once the directory is
+            fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY)
+
+            try:
+                os.fsync(fd)
+
+            finally:
+                os.close(fd)
+
+    def abort(self):
+        """Drops everything written, path is left as it was."""
+        if self.fd is None:
+            return
+
+        os.close(self.fd)
+        self.fd = None
+        os.unlink(self.temp_path)
+
+    def close(self):
+        self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+class MappedRoster():
+    """Random access to the members of a roster file.
+
+    The file is memory-mapped and members are decoded only
+    when asked for. Where each member starts is kept in a
+    sidecar index file (roster path + ".idx") that is rebuilt
+    when the size or mtime of the roster changes."""
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self.index_map = None
+
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+
+            # mmap() refuses empty files
+            if stat.st_size:
+                self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.map = b""
+
+        self.offsets = self.load_index(stat)
+
+        if self.offsets is None:
+            self.offsets = self.build_index()
+            self.save_index(stat)
+
+    def load_index(self, stat):
+        try:
+            with open(self.index_path, "rb") as file:
+                header = file.read(INDEX_HEADER.size)
+
+                if len(header) < INDEX_HEADER.size:
+                    return None
+
+                magic, size, mtime, count = INDEX_HEADER.unpack(header)
+
+                if (magic, size, mtime) != (
+                        INDEX_MAGIC, stat.st_size, stat.st_mtime_ns):
+                    return None
+
+                if os.fstat(file.fileno()).st_size != (
+                        INDEX_HEADER.size + 8 * count):
+                    return None
+
+                if not count:
+                    return array.array("q")
+
+                self.index_map = mmap.mmap(
+                        file.fileno(), 0, access=mmap.ACCESS_READ
+                        )
+
+        except FileNotFoundError:
+            return None
+
+        return memoryview(self.index_map)[INDEX_HEADER.size:].cast("q")
+
+    def build_index(self):
+        offsets = array.array("q")
+
+        if not self.map:
+            return offsets
+
+        start = 0
+        self.map.seek(0)
+
+        for line in iter(self.map.readline, b""):
+            # blank lines are skipped, as by RosterReader
+            if line.strip():
+                offsets.append(start)
+
+            start += len(line)
+
+        return offsets
+
+    def save_index(self, stat):
+        temp_path = self.index_path + ".tmp"
+        header = INDEX_HEADER.pack(
+                INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, len(self.offsets)
+                )
+
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(header)
+                self.offsets.tofile(file)
+
+            # readers see the old index or the new one
+            os.replace(temp_path, self.index_path)
+
+        except OSError:
+            # a read-only directory, index again next time
+            pass
+
+    def member(self, number):
+        start = self.offsets[number]
+        end = self.map.find(b"\n", start)
+
+        if end == -1:
+            end = len(self.map)
+
+        return self.map[start:end].decode("utf-8").strip()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            numbers = range(*index.indices(len(self)))
+
+            return [self.member(number) for number in numbers]
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("roster index out of range")
+
+        return self.member(index)
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self.member(number)
+
+    def close(self):
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+
+        if self.index_map is not None:
+            self.index_map.close()
+
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def werc_name(member):
+    """Picard -> Dracip"""
+    return member[::-1].title()
+
+def werc_names(members):
+    return (werc_name(member) for member in members)
+
+def transform_roster(source, target, transform=werc_names, extra=()):
+    """Writes transform(members of source) and then extra to
+    target in one pass, returns the number of lines written."""
+    with RosterReader(source) as reader, RosterWriter(target) as writer:
+        writer.write_all(transform(reader))
+        writer.write_all(extra)
+
+    return writer.count
+
+# Note: Nothing above builds a list, every member goes
+# from the reader through the generator to the writer
+# before the next one is read
+
+def chunk_ranges(path, chunk_size=CHUNK_SIZE):
+    """Splits a file into (start, end) byte ranges of about
+    chunk_size bytes, each ending right after a newline."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1 byte")
+
+    ranges = []
+
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        start = 0
+
+        while start < size:
+            end = start + chunk_size
+
+            if end >= size:
+                end = size
+            else:
+                # move on to the end of the line the chunk
+                # ends in, or stay if it ends with a newline
+                file.seek(end - 1)
+                file.readline()
+                end = file.tell()
+
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+def transform_range(path, start, end, transform=werc_name):
+    """Transforms the members in a byte range of a roster,
+    returns (encoded output lines, number of members)."""
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text = data[start:end].decode("utf-8")
+
+    lines = []
+
+    for line in text.split("\n"):
+        member = line.strip()
+
+        if member:
+            lines.append(transform(member) + "\n")
+
+    return "".join(lines).encode("utf-8"), len(lines)
+
+def transform_roster_parallel(source, target, transform=werc_name,
+        extra=(), workers=None, chunk_size=CHUNK_SIZE):
+    """transform_roster() on a process pool, for large rosters.
+
+    transform maps one member to one line here, and must be
+    a module-level function so the workers can unpickle it."""
+    workers = workers or os.cpu_count()
+    ranges = chunk_ranges(source, chunk_size)
+    pending = collections.deque()
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        with RosterWriter(target) as writer:
+            for start, end in ranges:
+                # the workers get offsets and read their chunk
+                # themselves, only the output is sent back
+                pending.append(executor.submit(
+                        transform_range, source, start, end, transform
+                        ))
+
+                # finished chunks are written in order, and at
+                # most two per worker wait to be written
+                if len(pending) >= 2 * workers:
+                    writer.write_encoded(*pending.popleft().result())
+
+            while pending:
+                writer.write_encoded(*pending.popleft().result())
+
+            writer.write_all(extra)
+
+    return writer.count
@@ -0,0 +1,160 @@
+# Python3 JSON Benchmark Example
+#
+# Saves a generated fleet the way older versions of
+# json-ex.py did (a JSON string holding the indented
+# array) and with dump_fleet(), compact and indented, then
+# compares the file sizes and how long it takes to get the
+# starships back. Run it with ./start-json-ex.sh
+# benchmark-ex.py, which creates the imports it needs.
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from captain import Captain
+from fleet import dump_fleet, load_fleet, read_fleet, schema
+from starships import Starship
+
+def build_fleet(size):
+    return [
+            Starship(
+                "Enterprise-%d" % number,
+                Captain("Jean-Luc", "Picard" if number % 2 else "")
+                )
+            for number in range(size)
+            ]
+
+def dump_double_encoded(starships, file):
+    # what json-ex.py used to do
+    json_data = json.dumps(starships, default=lambda o: o.__dict__, indent=4)
+    json.dump(json_data, file)
+
+def load_double_encoded(file):
+    # and how it had to be read back
+    starships = []
+
+    for starship in json.loads(json.load(file)):
+        starships.append(
+                Starship(
+                    starship["name"],
+                    Captain(
+                        starship["captain"]["name"],
+                        starship["captain"]["surname"]
+                            if "surname" in starship["captain"].keys()
+                            else ""
+                        )
+                    )
+                )
+
+    return starships
+
+def build(data):
+    # the captain first, like the parser does
+    for key, value in data.items():
+        if isinstance(value, dict):
+            data[key] = build(value)
+
+    return schema.hook(data)
+
+def load_dicts(file):
+    # a tree of dicts first, then the objects
+    return [build(starship) for starship in json.load(file)]
+
+def load_streaming(file):
+    return list(read_fleet(file))
+
+def parse_double_encoded(file):
+    return json.loads(json.load(file))
+
+def timed(function, path, *args):
+    best = None
+
+    # like timeit, no garbage collection in between
+    gc.disable()
+
+    try:
+        # best of five, the first one warms the page cache
+        for _ in range(5):
+            with open(path) as file:
+                start = time.perf_counter()
+                function(file, *args)
+                elapsed = time.perf_counter() - start
+
+            best = elapsed if best is None else min(best, elapsed)
+
+    finally:
+        gc.enable()
+
+    return best
+
+def peak_memory(function, path):
+    with open(path) as file:
+        tracemalloc.start()
+
+        try:
+            function(file)
+
+            return tracemalloc.get_traced_memory()[1]
+
+        finally:
+            tracemalloc.stop()
+
+parser = argparse.ArgumentParser(description="JSON benchmark example")
+parser.add_argument("--ships", type=int, default=100000)
+args = parser.parse_args()
+
+fleet = build_fleet(args.ships)
+
+with tempfile.TemporaryDirectory() as directory:
+    # name, writer, its arguments, parser, reader
+    formats = (
+            ("double encoded", dump_double_encoded, (),
+                parse_double_encoded, load_double_encoded),
+            ("  load_fleet()", dump_double_encoded, (),
+                parse_double_encoded, load_fleet),
+            ("compact", dump_fleet, (), json.load, load_fleet),
+            ("  dicts first", dump_fleet, (), json.load, load_dicts),
+            ("  read_fleet()", dump_fleet, (), json.load, load_streaming),
+            ("indent=4", dump_fleet, (4,), json.load, load_fleet),
+            )
+
+    print("%d starships %22s %9s %9s" % (args.ships, "parse", "load", "peak"))
+
+    for name, dump, dump_args, parse, load in formats:
+        path = os.path.join(directory, "starships.json")
+
+        with open(path, "w") as file:
+            dump(fleet, file, *dump_args)
+
+        print("%-16s %9d bytes  %6.3fs  %6.3fs  %5.1f MB" % (
+                name, os.path.getsize(path), timed(parse, path),
+                timed(load, path), peak_memory(load, path) / 1024 / 1024
+                ))
+# 100000 starships                  parse      load      peak
+# double encoded    17188895 bytes   0.259s   0.385s   68.4 MB
+#   load_fleet()    17188895 bytes   0.196s   0.395s   46.9 MB
+# compact            9838891 bytes   0.139s   0.322s   41.9 MB
+#   dicts first      9838891 bytes   0.135s   0.467s   64.9 MB
+#   read_fleet()     9838891 bytes   0.140s   0.512s   32.8 MB
+# indent=4          17838892 bytes   0.152s   0.315s   49.6 MB
+
+# Note: "parse" is json.load() alone (plus json.loads()
+# for the double encoded file), "load" includes building
+# the Starship and Captain objects. The compact file is
+# little more than half the size of the double encoded
+# one, which escapes every quote and newline of the
+# indented array
+
+# Note: load_fleet() builds the objects while parsing
+# (see schema.py), no tree of dicts is kept alive next to
+# them, hence the lower peak. "dicts first" calls the same
+# builders after json.load(), which also costs a walk over
+# the tree in Python
+
+# Note: read_fleet() pays for decoding one starship at a
+# time in Python, it is there for fleets that do not fit
+# in memory
@@ -0,0 +1,177 @@
+# Python3 JSON Fleet Module
+#
+# A fleet is a JSON array of starships, as written by
+# Starship.to_dict(). dump_fleet() and load_fleet() write
+# and read a whole list; write_fleet() and read_fleet()
+# handle it one starship at a time, so a fleet of millions
+# of ships never has to be in memory at once:
+#
+#   with open("starships.json", "w") as json_file:
+#       dump_fleet(starship_list, json_file)   # indent=4 to pretty-print
+#
+#   with open("fleet.json", "w") as fleet_file:
+#       write_fleet(fleet_file, starships)     # any iterable
+#
+#   with open("fleet.json") as fleet_file:
+#       for starship in read_fleet(fleet_file):
+#           ...
+#
+# Like json-ex.py, this needs the starships.py and captain.py
+# links that start-json-ex.sh creates.
+
+import json
+import re
+
+from captain import Captain
+from schema import SchemaDecoder
+from starships import KlingonStarship, Starship
+
+CHUNK_SIZE = 64 * 1024
+
+# starships joined into one write() call
+WRITE_BATCH = 1024
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# what read_fleet() expects next
+ARRAY, FIRST, STARSHIP, SEPARATOR = range(4)
+
+# no spaces after , and : unless pretty-printed
+COMPACT = (",", ":")
+
+encoder = json.JSONEncoder(separators=COMPACT)
+
+# builds the objects while parsing, see schema.py
+schema = SchemaDecoder(Captain, Starship, KlingonStarship)
+
+def encode_starship(starship):
+    return encoder.encode(starship.to_dict())
+
+def check_starship(starship):
+    if not isinstance(starship, Starship):
+        raise ValueError("Not a starship: %r" % (starship,))
+
+    return starship
+
+def dump_fleet(starships, file, indent=None):
+    """Writes starships as one JSON array, compact unless
+    indent is given."""
+    json.dump(
+            [starship.to_dict() for starship in starships], file,
+            indent=indent, separators=None if indent else COMPACT
+            )
+
+def load_fleet(file):
+    """Returns the list of starships in a file written by
+    dump_fleet() or write_fleet().
+
+    Also reads the files of older json-ex.py versions, which
+    held the fleet as a JSON string with the array inside."""
+    data = json.load(file, object_hook=schema.hook)
+
+    if isinstance(data, str):
+        data = json.loads(data, object_hook=schema.hook)
+
+    if not isinstance(data, list):
+        raise ValueError("Not a fleet: %r" % (data,))
+
+    for starship in data:
+        check_starship(starship)
+
+    return data
+
+def write_fleet(file, starships):
+    """Writes starships as a JSON array, one per line,
+    returns the number of starships written."""
+    count = 0
+    parts = ["["]
+
+    for starship in starships:
+        parts.append(",\n" if count else "\n")
+        parts.append(encode_starship(starship))
+        count += 1
+
+        if len(parts) >= 2 * WRITE_BATCH:
+            file.write("".join(parts))
+            parts.clear()
+
+    parts.append("\n]\n" if count else "]\n")
+    file.write("".join(parts))
+
+    return count
+
+def read_fleet(file, chunk_size=CHUNK_SIZE):
+    """Yields the starships of a JSON array one by one.
+
+    The file is read in chunks and only the starship being
+    decoded is kept, whatever the layout of the array."""
+    decoder = json.JSONDecoder(object_hook=schema.hook)
+    buffer = ""
+    position = 0
+    expected = ARRAY
+    end_of_file = False
+
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+
+        if position == len(buffer):
+            if end_of_file:
+                raise json.JSONDecodeError(
+                        "Fleet ends before the array", buffer, position
+                        )
+
+            buffer, position, end_of_file = read_more(
+                    file, chunk_size, buffer, position
+                    )
+            continue
+
+        if expected == ARRAY:
+            if buffer[position] != "[":
+                raise json.JSONDecodeError(
+                        "Expecting '[' at the start of a fleet",
+                        buffer, position
+                        )
+
+            position += 1
+            expected = FIRST
+
+        elif expected == SEPARATOR or (
+                expected == FIRST and buffer[position] == "]"):
+            if buffer[position] == "]":
+                return
+
+            if buffer[position] != ",":
+                raise json.JSONDecodeError(
+                        "Expecting ',' delimiter", buffer, position
+                        )
+
+            position += 1
+            expected = STARSHIP
+
+        else:
+            try:
+                data, position = decoder.raw_decode(buffer, position)
+
+            except json.JSONDecodeError:
+                # most likely a starship cut at the chunk end
+                if end_of_file:
+                    raise
+
+                buffer, position, end_of_file = read_more(
+                        file, chunk_size, buffer, position
+                        )
+                continue
+
+            expected = SEPARATOR
+
+            yield check_starship(data)
+
+def read_more(file, chunk_size, buffer, position):
+    """Drops what was decoded, returns the rest plus a new chunk."""
+    chunk = file.read(chunk_size)
+
+    return buffer[position:] + chunk, 0, not chunk
+
+# Note: json.load() would build a list of every starship
+# first; here a starship is yielded as soon as its closing
+# brace has been read
@@ -3,73 +3,45 @@
 import json
 
 from captain import Captain
+from fleet import dump_fleet, load_fleet, read_fleet, write_fleet
 from starships import Starship, KlingonStarship
 
 starship_list = [
         Starship("Enterprise", Captain(name="Jean-Luc", surname="Picard")),
         Starship("Voyager", Captain(name="Kathryn", surname="Janeway")),
         Starship("Defiant", Captain(name="Benjamin", surname="Sisco")),
-        Starship("Unknown", Captain(name="Nobody"))
+        Starship("Unknown", Captain(name="Nobody")),
+        KlingonStarship(Captain(name="Worf"))
         ]
 
-json_data = json.dumps(starship_list, default=lambda o: o.__dict__, indent=4)
-
 with open("starships.json", "w") as json_file:
-    json.dump(json_data, json_file)
+    dump_fleet(starship_list, json_file)
 
 with open("starships.json") as json_file:
-    json_data_reloaded = json.load(json_file)
-
-print(json_data_reloaded)
-# [
-#     {
-#         "name": "Enterprise",
-#         "captain": {
-#             "name": "Jean-Luc",
-#             "surname": "Picard"
-#         },
-#         "stardate": 0
-#     },
-#     {
-#         "name": "Voyager",
-#         "captain": {
-#             "name": "Kathryn",
-#             "surname": "Janeway"
-#         },
-#         "stardate": 0
-#     },
-#     {
-#         "name": "Defiant",
-#         "captain": {
-#             "name": "Benjamin",
-#             "surname": "Sisco"
-#         },
-#         "stardate": 0
+    print(json_file.read())
+# [{"type":"Starship","name":"Enterprise","captain":{"name":"Jean-Luc","surname":"Picard"},"stardate":0},{"type":"Starship","name":"Voyager","captain":{"name":"Kathryn","surname":"Janeway"},"stardate":0},{"type":"Starship","name":"Defiant","captain":{"name":"Benjamin","surname":"Sisco"},"stardate":0},{"type":"Starship","name":"Unknown","captain":{"name":"Nobody"},"stardate":0},{"type":"KlingonStarship","name":"Unknown","captain":{"name":"Worf"},"stardate":0,"lasers":true}]
+
+print(json.dumps(starship_list[0].to_dict(), indent=4))
+# {
+#     "type": "Starship",
+#     "name": "Enterprise",
+#     "captain": {
+#         "name": "Jean-Luc",
+#         "surname": "Picard"
 #     },
-#     {
-#         "name": "Unknown",
-#         "captain": {
-#             "name": "Nobody"
-#         },
-#         "stardate": 0
-#     }
-# ]
-starship_list_reloaded = []
-
-for starship in json.loads(json_data_reloaded):
-
-    starship_list_reloaded.append(
-
-        Starship(
-            starship["name"],
-            Captain(
-                starship["captain"]["name"],
-                starship["captain"]["surname"]
-                    if "surname" in starship["captain"].keys()
-                    else ""
-                )
-            )
-        )
+#     "stardate": 0
+# }
+
+# Note: dump_fleet(starship_list, json_file, indent=4)
+# writes the pretty-printed form, which is bigger
+
+# Note: Older versions of this example wrote the result
+# of json.dumps() with json.dump() again, so the file held
+# a JSON string that had to be decoded twice. load_fleet()
+# still reads such files
+
+with open("starships.json") as json_file:
+    starship_list_reloaded = load_fleet(json_file)
 
 print("Starship list:")
 for starship in starship_list_reloaded:
@@ -77,8 +49,38 @@ for starship in starship_list_reloaded:
             "\t* {}\t{}".format(starship.name, starship.captain.get_name())
         )
 # Starship list:
-# 	* Enterprise	(captain: Jean-Luc Picard)
-# 	* Voyager	(captain: Kathryn Janeway)
-# 	* Defiant	(captain: Benjamin Sisco)
-# 	* Unknown	(captain: Nobody)
+# 	* Enterprise	Jean-Luc Picard
+# 	* Voyager	Kathryn Janeway
+# 	* Defiant	Benjamin Sisco
+# 	* Unknown	Nobody
+# 	* Unknown	Worf
+
+print(type(starship_list_reloaded[-1]).__name__)
+# KlingonStarship
+
+# Note: load_fleet() builds the Starship, KlingonStarship
+# and Captain objects while the JSON is parsed, picking
+# the class by the "type" key (see schema.py)
+
+
+# <-- streaming a fleet -->
+
+def build_fleet(size):
+    for number in range(size):
+        yield Starship("Enterprise-%d" % number, Captain("Jean-Luc", "Picard"))
+
+with open("fleet.json", "w") as fleet_file:
+    print("Starships written: %d" % write_fleet(fleet_file, build_fleet(1000)))
+# Starships written: 1000
+
+with open("fleet.json") as fleet_file:
+    for starship in read_fleet(fleet_file):
+        if starship.name.endswith("-999"):
+            print(
+                    "\t* {}\t{}".format(starship.name, starship.captain.get_name())
+                )
+# 	* Enterprise-999	Jean-Luc Picard
 
+# Note: Neither the fleet nor the file is ever in memory
+# as a whole, build_fleet() and read_fleet() are both
+# generators
@@ -0,0 +1,151 @@
+# Python3 JSON Schema Module
+#
+# Turns JSON objects into instances of the classes in
+# python/basic/classes-ex while json.loads() parses them,
+# instead of returning a tree of dicts to convert later:
+#
+#   decoder = SchemaDecoder(Captain, Starship, KlingonStarship)
+#   json.loads(text, object_hook=decoder.hook)
+#
+# Every class lists the keys it is written with in FIELDS,
+# the ones that must be there in REQUIRED, values for
+# missing ones in DEFAULTS and the class of nested objects
+# in TYPES. From these a build function is compiled once
+# per class, which sets the attributes of a new instance
+# without calling __init__(). Like Captain.__init__(), it
+# leaves out optional fields without a default when they
+# are empty ("surname": "" gives no surname attribute).
+#
+# An object with a "type" key becomes the class of that
+# name (a subclass is picked by its tag). One without it
+# becomes the first class whose fields match its keys, so
+# untagged captains and older files still decode.
+
+TYPE_KEY = "type"
+
+def keep(data):
+    # objects none of the classes matches stay dicts
+    return data
+
+def mismatch(cls, field, expected, value):
+    raise ValueError("%s %s is not a %s: %r" % (
+            cls.__name__, field, expected.__name__, value
+            ))
+
+class ClassSchema():
+    """What it takes to build one class from a JSON object."""
+
+    __slots__ = ("cls", "tag", "fields", "required", "build")
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.tag = cls.__name__
+        self.fields = frozenset(cls.FIELDS)
+        self.required = frozenset(cls.REQUIRED)
+        self.build = self.compile()
+
+    def matches(self, keys):
+        return self.required <= keys <= self.fields
+
+    def compile(self):
+        """Returns a function building an instance from a
+        dict, with the keys of this class written into its
+        code."""
+        namespace = {
+                "new": object.__new__, "cls": self.cls, "mismatch": mismatch
+                }
+        lines = ["def build(data):", "    instance = new(cls)"]
+
+        for number, field in enumerate(self.cls.FIELDS):
+            if not field.isidentifier():
+                raise ValueError("%s field %r is not a name" % (self.tag, field))
+
+            indent = "    "
+
+            if field in self.required:
+                lines.append("    value = data[%r]" % field)
+            elif field in self.cls.DEFAULTS:
+                namespace["default_%d" % number] = self.cls.DEFAULTS[field]
+                lines.append(
+                        "    value = data.get(%r, default_%d)" % (field, number)
+                        )
+            else:
+                # no default, the attribute is left out
+                lines.append("    value = data.get(%r)" % field)
+                lines.append("    if value:")
+                indent = "        "
+
+            if field in self.cls.TYPES:
+                # nested objects have been built already
+                namespace["type_%d" % number] = self.cls.TYPES[field]
+                lines.append(
+                        "%sif not isinstance(value, type_%d):" %
+                        (indent, number)
+                        )
+                lines.append(
+                        "%s    mismatch(cls, %r, type_%d, value)" %
+                        (indent, field, number)
+                        )
+
+            lines.append("%sinstance.%s = value" % (indent, field))
+
+        lines.append("    return instance")
+
+        exec("\n".join(lines), namespace)
+
+        return namespace["build"]
+
+class SchemaDecoder():
+    """An object_hook building instances of classes.
+
+    The build function picked for a type tag and layout of
+    keys is remembered, so the keys are only checked once
+    per layout, not once per object."""
+
+    def __init__(self, *classes):
+        self.schemas = [ClassSchema(cls) for cls in classes]
+        self.by_tag = {schema.tag: schema for schema in self.schemas}
+        self.builders = {}
+
+    def hook(self, data):
+        tag = data.pop(TYPE_KEY, None)
+        layout = (tag, tuple(data))
+
+        try:
+            build = self.builders[layout]
+
+        except KeyError:
+            build = self.builders[layout] = self.compile(*layout)
+
+        except TypeError:
+            raise ValueError("Type tag %r is not a string" % (tag,))
+
+        return build(data)
+
+    def compile(self, tag, keys):
+        """Returns the build function for objects with this
+        tag and these keys."""
+        key_set = frozenset(keys)
+
+        if tag is None:
+            for schema in self.schemas:
+                if schema.matches(key_set):
+                    return schema.build
+
+            return keep
+
+        schema = self.by_tag.get(tag)
+
+        if schema is None:
+            raise ValueError("Unknown type %s" % tag)
+
+        if not schema.matches(key_set):
+            raise ValueError("%s expects %s, got %s" % (
+                    tag, ", ".join(schema.cls.FIELDS), ", ".join(keys)
+                    ))
+
+        return schema.build
+
+# Note: Objects written by to_dict() have the same keys
+# in the same order, compile() runs once per class and
+# every other object costs one dictionary lookup
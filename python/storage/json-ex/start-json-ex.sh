@@ -6,7 +6,12 @@ CAPTAIN_EX=`realpath ../../basic/classes-ex/captain.py`
 ln -s "$CLASSES_EX" `pwd`/starships.py
 ln -s "$CAPTAIN_EX" `pwd`/captain.py
 
-python3 json-ex.py
+# e.g. ./start-json-ex.sh benchmark-ex.py --ships 10000
+if [ $# -eq 0 ]; then
+    set -- json-ex.py
+fi
+
+python3 "$@"
 
 unlink starships.py
 unlink captain.py
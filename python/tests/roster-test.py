@@ -0,0 +1,74 @@
+# Python3 Roster Tests
+#
+# Tests for python/storage/files-ex/roster.py
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "storage", "files-ex"
+        ))
+
+from roster import RosterWriter, transform_roster, transform_roster_parallel
+
+class RosterTestCase(unittest.TestCase):
+    """Tests for RosterWriter and the roster transforms"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = self.path("crew.txt")
+        self.target = self.path("werc.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def read(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+    def test_parallel_roster_ending_in_blank_lines(self):
+        with open(self.source, "w") as file:
+            file.write("Picard\n" + "\n" * 9)
+
+        # small chunks, most of them hold blank lines only
+        count = transform_roster_parallel(
+                self.source, self.target, workers=2, chunk_size=4
+                )
+
+        self.assertEqual(count, 1)
+        self.assertEqual(self.read(self.target), b"Dracip\n")
+        self.assertEqual(
+                sorted(os.listdir(self.directory.name)), ["crew.txt", "werc.txt"]
+                )
+
+    def test_parallel_matches_sequential(self):
+        with open(self.source, "w") as file:
+            file.write("Picard\nRiker\n\nData\nGeordi")
+
+        expected = self.path("expected.txt")
+        transform_roster(self.source, expected, extra=["Q"])
+        transform_roster_parallel(
+                self.source, self.target, extra=["Q"], workers=2, chunk_size=8
+                )
+
+        self.assertEqual(self.read(self.target), self.read(expected))
+
+    def test_write_encoded_empty(self):
+        with RosterWriter(self.target) as writer:
+            writer.write_encoded(b"", 0)
+            writer.write("Q")
+            writer.write_encoded(b"", 0)
+
+        self.assertEqual(self.read(self.target), b"Q\n")
+
+# Note: An empty part used to make flush() loop forever
+
+unittest.main()
+
+# Note: Run with python3 roster-test.py
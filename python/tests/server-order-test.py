@@ -0,0 +1,226 @@
+# Python3 Selector Server Reply Order Tests
+#
+# Loads python/network/multiple-clients-server/server-ex.py
+# and checks that replies are queued in the order the
+# messages arrived, while offloaded batches are running,
+# and that the read timeout is counted per frame.
+
+import argparse
+import concurrent.futures
+import importlib.util
+import logging
+import os
+import selectors
+import socket
+import sys
+import unittest
+
+NETWORK_DIR = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "network"
+        )
+SERVER_DIR = os.path.join(NETWORK_DIR, "multiple-clients-server")
+
+sys.path.append(SERVER_DIR)
+
+spec = importlib.util.spec_from_file_location(
+        "server", os.path.join(SERVER_DIR, "server-ex.py")
+        )
+server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(server)
+
+from connection import Connection
+from framing import encode_frame
+from stats import STATS_COMMAND, ServerStats
+from timer_wheel import TimerWheel
+
+class OffloadedDispatcher():
+    """Returns a Future per batch, finished by the test."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, messages):
+        future = concurrent.futures.Future()
+        self.futures.append(future)
+
+        return future
+
+class InlineDispatcher():
+    """Returns the same replies for every batch."""
+
+    def __init__(self, replies):
+        self.replies = replies
+
+    def submit(self, messages):
+        return self.replies
+
+class Key():
+    def __init__(self, fd, data):
+        self.fd = fd
+        self.data = data
+        self.events = selectors.EVENT_READ
+
+class ReplyOrderTestCase(unittest.TestCase):
+    """Tests for dispatch_batch() and collect_replies()"""
+
+    def setUp(self):
+        self.client, self.peer = socket.socketpair()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_w.setblocking(False)
+
+        server.log = logging.getLogger("server-order-test")
+        server.sel = selectors.DefaultSelector()
+        server.stats = ServerStats()
+        server.dispatcher = OffloadedDispatcher()
+        server.server_args = argparse.Namespace(batch_replies=True)
+        server.wake_w = self.wake_w
+        server.batch = []
+        server.in_flight.clear()
+        server.pending_flush.clear()
+
+        self.key = Key(self.peer.fileno(), Connection(self.peer, "test client"))
+
+    def tearDown(self):
+        server.sel.close()
+
+        for sock in (self.client, self.peer, self.wake_r, self.wake_w):
+            sock.close()
+
+    def receive(self, *messages):
+        for data in messages:
+            server.batch.append((self.key, data, None))
+
+        server.dispatch_batch()
+        server.collect_replies()
+
+    def replies(self):
+        return [bytes(view) for view in self.key.data.outq]
+
+    def test_stats_waits_for_offloaded_batch(self):
+        self.receive(b"hello")
+        self.receive(STATS_COMMAND)
+
+        # nothing may be queued before the reply to hello
+        self.assertEqual(self.replies(), [])
+
+        server.dispatcher.futures[0].set_result([b"done"])
+        server.collect_replies()
+
+        replies = self.replies()
+        self.assertEqual(len(replies), 2)
+        self.assertEqual(replies[0], encode_frame(b"done"))
+        self.assertIn(b"messages_in", replies[1])
+
+# Note: The STATS batch has no message for the handler,
+# before the fix its reply was queued right away
+
+    def test_batches_are_delivered_in_order(self):
+        self.receive(b"first")
+        self.receive(b"second")
+
+        # the second batch finishes first
+        server.dispatcher.futures[1].set_result([b"2"])
+        server.collect_replies()
+        self.assertEqual(self.replies(), [])
+
+        server.dispatcher.futures[0].set_result([b"1"])
+        server.collect_replies()
+        self.assertEqual(
+                self.replies(), [encode_frame(b"1"), encode_frame(b"2")]
+                )
+
+    def test_stats_without_batch_in_flight(self):
+        self.receive(STATS_COMMAND)
+
+        self.assertEqual(len(self.replies()), 1)
+        self.assertEqual(len(server.in_flight), 0)
+        self.assertIn(self.key.fd, server.pending_flush)
+
+    def test_replies_sent_right_away_without_batch_replies(self):
+        server.server_args.batch_replies = False
+
+        self.receive(b"first", b"second")
+        server.dispatcher.futures[0].set_result([b"1", b"2"])
+        server.collect_replies()
+
+        self.assertEqual(self.replies(), [])
+        self.assertEqual(server.pending_flush, {})
+        self.assertEqual(
+                self.client.recv(100), encode_frame(b"1") + encode_frame(b"2")
+                )
+
+    def test_too_few_replies(self):
+        self.receive(b"first", b"second")
+        server.dispatcher.futures[0].set_result([b"OK"])
+        server.collect_replies()
+
+        replies = self.replies()
+        self.assertEqual(len(replies), 2)
+
+        for reply in replies:
+            self.assertIn(b"ERROR handler returned 1 replies", reply)
+
+    def test_reply_not_bytes(self):
+        server.dispatcher = InlineDispatcher(["OK"])
+        self.receive(b"hello")
+
+        replies = self.replies()
+        self.assertEqual(len(replies), 1)
+        self.assertIn(b"ERROR handler returned str", replies[0])
+
+# Note: Both used to raise out of the event loop
+
+class ReadTimeoutTestCase(unittest.TestCase):
+    """Tests for the read timer armed by process_data()"""
+
+    def setUp(self):
+        self.client, self.peer = socket.socketpair()
+
+        server.log = logging.getLogger("server-order-test")
+        server.sel = selectors.DefaultSelector()
+        server.stats = ServerStats()
+        server.timers = TimerWheel()
+        server.message_log = lambda addr, data: None
+        server.read_timeout = 30
+        server.batch = []
+
+        self.key = Key(self.peer.fileno(), Connection(self.peer, "test client"))
+
+    def tearDown(self):
+        server.sel.close()
+        server.batch = []
+
+        for sock in (self.client, self.peer):
+            sock.close()
+
+    def send(self, data):
+        self.client.sendall(data)
+        server.process_data(self.key, selectors.EVENT_READ, server.sel)
+
+        return self.key.data.read_timer
+
+    def test_timer_restarts_with_every_frame(self):
+        frame = encode_frame(b"x" * 3000)
+
+        first = self.send(frame[:10])
+        self.assertIsNotNone(first)
+
+        # still the same frame, the timer keeps running
+        self.assertIs(self.send(frame[10:20]), first)
+
+        # a frame completed and the next one started
+        second = self.send(frame[20:] + frame[:10])
+        self.assertIsNotNone(second)
+        self.assertIsNot(second, first)
+        self.assertIsNone(first.slot)
+
+        self.assertIsNone(self.send(frame[10:]))
+        self.assertEqual(len(server.timers), 0)
+        self.assertEqual(len(server.batch), 2)
+
+# Note: Before, a client that always had part of a frame
+# buffered was timed out however fast frames completed
+
+unittest.main()
+
+# Note: Run with python3 server-order-test.py
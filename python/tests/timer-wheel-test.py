@@ -0,0 +1,71 @@
+# Python3 Timer Wheel Tests
+#
+# Tests for python/network/multiple-clients-server/timer_wheel.py
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "network", "multiple-clients-server"
+        ))
+
+from timer_wheel import TimerWheel
+
+TICK = 0.01
+
+class TimerWheelTestCase(unittest.TestCase):
+    """Tests for TimerWheel.advance() and cancel()"""
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=TICK, slots=8)
+        self.fired = []
+
+    def wait(self):
+        # the timers below are all due after this
+        time.sleep(3 * TICK)
+
+    def test_fires_due_timers(self):
+        self.wheel.schedule(0, lambda: self.fired.append("a"))
+        self.wheel.schedule(0, lambda: self.fired.append("b"))
+        self.wait()
+
+        self.assertEqual(self.wheel.advance(), 2)
+        self.assertEqual(sorted(self.fired), ["a", "b"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel(self):
+        timer = self.wheel.schedule(0, lambda: self.fired.append("a"))
+        self.wheel.cancel(timer)
+        self.wheel.cancel(timer)
+        self.wait()
+
+        self.assertEqual(self.wheel.advance(), 0)
+        self.assertEqual(self.fired, [])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel_during_advance(self):
+        timers = []
+
+        def fire(index):
+            # like an idle timer closing the connection,
+            # which cancels its read timer due as well
+            self.fired.append(index)
+            self.wheel.cancel(timers[1 - index])
+
+        timers.append(self.wheel.schedule(0, lambda: fire(0)))
+        timers.append(self.wheel.schedule(0, lambda: fire(1)))
+        self.wait()
+
+        self.assertEqual(self.wheel.advance(), 1)
+        self.assertEqual(len(self.fired), 1)
+        self.assertEqual(len(self.wheel), 0)
+
+# Note: Both timers are in the same slot and due on the
+# same tick, whichever fires first cancels the other
+
+unittest.main()
+
+# Note: Run with python3 timer-wheel-test.py